@@ -0,0 +1,90 @@
+import os
+import json
+import time
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_COMPLETION_WINDOW = "24h"
+BATCH_TERMINAL_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def write_batch_file(requests, path):
+    """Write (custom_id, chat completion body) pairs as a Batch API JSONL input file."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for custom_id, body in requests:
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": body}
+            f.write(json.dumps(line, ensure_ascii=False) + "\n")
+
+
+def submit_batch(client, path):
+    """Upload the JSONL input file and create a batch job for it."""
+    with open(path, 'rb') as f:
+        input_file = client.files.create(file=f, purpose="batch")
+    batch = client.batches.create(
+        input_file_id=input_file.id,
+        endpoint=BATCH_ENDPOINT,
+        completion_window=BATCH_COMPLETION_WINDOW,
+    )
+    print(f"Submitted batch {batch.id} ({path})")
+    return batch
+
+
+def wait_for_batch(client, batch_id, poll_interval):
+    """Poll the batch until it reaches a terminal status and return it."""
+    while True:
+        batch = client.batches.retrieve(batch_id)
+        counts = batch.request_counts
+        progress = f" ({counts.completed}/{counts.total} requests done)" if counts else ""
+        print(f"Batch {batch_id} status: {batch.status}{progress}")
+        if batch.status in BATCH_TERMINAL_STATUSES:
+            return batch
+        time.sleep(poll_interval)
+
+
+def cancel_batch(client, batch_id):
+    """Ask the server to cancel a batch that is no longer being waited for, so it stops running and billing."""
+    try:
+        client.batches.cancel(batch_id)
+        print(f"Cancelled batch {batch_id}")
+    except Exception as e:
+        print(f"Warning: Could not cancel batch {batch_id}: {e}")
+
+
+def download_batch_results(client, batch, path):
+    """Save the batch output file and return a dict of custom_id -> chat completion body for successful requests."""
+    if not batch.output_file_id:
+        return {}
+
+    content = client.files.content(batch.output_file_id).text
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(content)
+
+    bodies = {}
+    for line in content.splitlines():
+        if not line.strip():
+            continue
+        result = json.loads(line)
+        response = result.get("response") or {}
+        if result.get("error") or response.get("status_code") != 200:
+            print(f"Warning: Batch request {result.get('custom_id')} failed: {result.get('error') or response.get('status_code')}")
+            continue
+        bodies[result["custom_id"]] = response["body"]
+    return bodies
+
+
+def run_batch(client, requests, batch_dir, poll_interval=30):
+    """Submit the requests as one batch, wait for it and return a dict of custom_id -> chat completion body."""
+    os.makedirs(batch_dir, exist_ok=True)
+    input_path = os.path.join(batch_dir, 'batch_requests.jsonl')
+    output_path = os.path.join(batch_dir, 'batch_results.jsonl')
+
+    write_batch_file(requests, input_path)
+    batch = submit_batch(client, input_path)
+    try:
+        batch = wait_for_batch(client, batch.id, poll_interval)
+    except Exception:
+        # The caller falls back to other requests, so the abandoned batch must not keep running
+        cancel_batch(client, batch.id)
+        raise
+    if batch.status != "completed":
+        print(f"Warning: Batch {batch.id} ended with status '{batch.status}'")
+    return download_batch_results(client, batch, output_path)
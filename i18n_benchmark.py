@@ -0,0 +1,291 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import resource
+import tempfile
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from i18n_checker import compare_keys_in_locales, find_unused_keys
+from i18n_locale_tree import LocaleTreeLoader
+from i18n_patch_locales import main as patch_main
+from i18n_qa import generate_translation_comparison
+from i18n_translator import load_csv_files, save_updated_df, update_translations_in_dataframe
+
+# Stages in the order they run; later stages read what earlier ones wrote, as in the README workflow
+STAGES = ('compare', 'unused', 'update_translations', 'patch', 'qa')
+STAGE_INPUTS = {'update_translations': ('compare',), 'patch': ('compare', 'update_translations')}
+WORDS = ('wallet', 'mining', 'balance', 'node', 'block', 'reward', 'settings', 'connect', 'start', 'stop',
+         'airdrop', 'transaction', 'address', 'network', 'status', 'sync', 'error', 'retry', 'open', 'close')
+
+
+def synthetic_text(rng, length):
+    """Return pseudo-English text of roughly the given length."""
+    words = []
+    while sum(len(word) + 1 for word in words) < length:
+        words.append(rng.choice(WORDS))
+    return ' '.join(words).capitalize()
+
+
+def synthetic_keys(rng, keys, depth):
+    """Return dotted key paths spread over nested groups up to the given depth."""
+    paths = []
+    for index in range(keys):
+        groups = [f"group{rng.randrange(4)}" for _ in range(rng.randrange(depth))]
+        paths.append('.'.join(groups + [f"key{index}"]))
+    return paths
+
+
+def nest(flat):
+    """Turn {dotted path: value} into nested dicts."""
+    data = {}
+    for path, value in flat.items():
+        node = data
+        *parents, leaf = path.split('.')
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[leaf] = value
+    return data
+
+
+def generate_corpus(root, locales=30, files=20, keys=300, depth=3, string_length=40, missing_ratio=0.1,
+                    source_files=500, used_ratio=0.8, seed=0):
+    """Write a synthetic locale tree and source tree under root and return their paths and the number of English keys.
+
+    Every non-English locale misses about missing_ratio of the keys and repeats English for as many more,
+    so compare, translate and patch all have work to do. The source tree references about used_ratio of the keys.
+    """
+    rng = random.Random(seed)
+    base_path = os.path.join(root, 'locales')
+    source_path = os.path.join(root, 'src')
+    all_keys = []
+
+    for file_index in range(files):
+        json_file = f"namespace{file_index}.json"
+        en_values = {path: synthetic_text(rng, string_length) for path in synthetic_keys(rng, keys, depth)}
+        all_keys.extend(en_values)
+        for locale in ['en'] + [f"l{index:02d}" for index in range(locales)]:
+            if locale == 'en':
+                values = en_values
+            else:
+                values = {}
+                for path, value in en_values.items():
+                    roll = rng.random()
+                    if roll < missing_ratio:
+                        continue
+                    values[path] = value if roll < 2 * missing_ratio else f"[{locale}] {value}"
+            os.makedirs(os.path.join(base_path, locale), exist_ok=True)
+            with open(os.path.join(base_path, locale, json_file), 'w', encoding='utf-8') as f:
+                json.dump(nest(values), f, ensure_ascii=False, indent=2)
+
+    used_keys = [key for key in all_keys if rng.random() < used_ratio]
+    for file_index in range(source_files):
+        directory = os.path.join(source_path, f"module{file_index % 20}")
+        os.makedirs(directory, exist_ok=True)
+        lines = [f"export const Component{file_index} = () => {{"]
+        for _ in range(40):
+            if used_keys and rng.random() < 0.5:
+                lines.append(f"  const label = t('{rng.choice(used_keys)}');")
+            else:
+                lines.append(f"  // {synthetic_text(rng, string_length)}")
+        lines.append("};")
+        with open(os.path.join(directory, f"component{file_index}.tsx"), 'w', encoding='utf-8') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    return {'base_path': base_path, 'en_path': os.path.join(base_path, 'en'), 'source_path': source_path,
+            'output_dir': os.path.join(root, 'output'), 'patched_path': os.path.join(root, 'patched'), 'keys': len(all_keys)}
+
+
+def peak_rss_mb():
+    """Return this process's peak resident set size in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024  # Bytes on macOS, KB on Linux
+
+
+def synthetic_translations(locale_key_comparison_df, english_labels_df):
+    """Build one translation per missing row, in the shape process_missing_translations returns."""
+    english = dict(zip(english_labels_df['label_key'], english_labels_df['value']))
+    missing = locale_key_comparison_df[locale_key_comparison_df['status'] == 'missing']
+    return [{"key": key, "en": english.get(key), "translated_value": f"[{locale}] {english.get(key)}", "locale": locale}
+            for locale, key in missing[['locale', 'label_key']].itertuples(index=False)]
+
+
+def run_stage(stage, paths, jobs):
+    """Run one stage in this (fresh) process and return (wall seconds of the stage call, peak RSS in MB,
+    growth of the peak RSS over what the process already used after importing the tools).
+
+    Inputs a stage reads from earlier stages are loaded before the clock starts.
+    """
+    output_dir = paths['output_dir']
+    rss_before = peak_rss_mb()
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        if stage == 'compare':
+            started = time.perf_counter()
+            compare_keys_in_locales(paths['base_path'], paths['en_path'], output_dir, use_manifest=False,
+                                    loader=LocaleTreeLoader(snapshot_path=''), jobs=jobs)
+            elapsed = time.perf_counter() - started
+        elif stage == 'unused':
+            started = time.perf_counter()
+            find_unused_keys(paths['en_path'], paths['source_path'], output_dir, use_cache=False,
+                             loader=LocaleTreeLoader(snapshot_path=''))
+            elapsed = time.perf_counter() - started
+        elif stage == 'update_translations':
+            english_labels_df, locale_key_comparison_df = load_csv_files(
+                os.path.join(output_dir, 'english_labels.csv'),
+                os.path.join(output_dir, 'locale_key_comparison_consolidated.csv'))
+            translations = synthetic_translations(locale_key_comparison_df, english_labels_df)
+            started = time.perf_counter()
+            updated_df = update_translations_in_dataframe(translations, locale_key_comparison_df)
+            elapsed = time.perf_counter() - started
+            save_updated_df(updated_df, os.path.join(output_dir, 'translated_locale_key_comparison_consolidated.csv'))
+        elif stage == 'patch':
+            shutil.rmtree(paths['patched_path'], ignore_errors=True)
+            sys.argv = ['i18n_patch_locales.py', '--source-locale-path', paths['base_path'],
+                        '--target-locale-path', paths['patched_path'], '--jobs', str(jobs),
+                        '--output-dir', output_dir, '--no-metrics',
+                        '--csv-file', os.path.join(output_dir, 'translated_locale_key_comparison_consolidated.csv')]
+            started = time.perf_counter()
+            patch_main()
+            elapsed = time.perf_counter() - started
+        elif stage == 'qa':
+            started = time.perf_counter()
+            generate_translation_comparison(paths['base_path'], paths['en_path'], output_dir,
+                                            loader=LocaleTreeLoader(snapshot_path=''))
+            elapsed = time.perf_counter() - started
+        else:
+            raise ValueError(f"Unknown stage {stage}")
+    rss_after = peak_rss_mb()
+    return elapsed, rss_after, rss_after - rss_before
+
+
+def benchmark_stages(stages, paths, jobs=1, repeat=1):
+    """Run every stage repeat times, each in a fresh process so peak RSS is per stage, and keep the best wall time.
+
+    Earlier stages whose output a selected stage reads are run once first, untimed.
+    """
+    context = multiprocessing.get_context('spawn')
+    for stage in STAGES:
+        if stage not in stages and any(stage in STAGE_INPUTS.get(selected, ()) for selected in stages):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                executor.submit(run_stage, stage, paths, jobs).result()
+
+    results = {}
+    for stage in stages:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(run_stage, stage, paths, jobs).result())
+        results[stage] = {
+            'wall_s': round(min(wall for wall, _, _ in runs), 4),
+            'peak_rss_mb': round(max(rss for _, rss, _ in runs), 1),
+            'rss_growth_mb': round(max(growth for _, _, growth in runs), 1),
+            'runs_s': [round(wall, 4) for wall, _, _ in runs],
+        }
+        print(f"{stage:<20} {results[stage]['wall_s']:>9.3f}s {results[stage]['peak_rss_mb']:>9.1f} MB peak "
+              f"(+{results[stage]['rss_growth_mb']:.1f} MB)")
+    return results
+
+
+def find_regressions(results, baseline, tolerance=0.2, min_wall_delta=0.05):
+    """Return a message for every stage that is slower or bigger than the baseline by more than the tolerance.
+
+    Wall-time changes smaller than min_wall_delta seconds are treated as noise.
+    """
+    regressions = []
+    for stage, result in results['stages'].items():
+        previous = baseline.get('stages', {}).get(stage)
+        if previous is None:
+            continue
+        wall_limit = previous['wall_s'] * (1 + tolerance)
+        if result['wall_s'] > wall_limit and result['wall_s'] - previous['wall_s'] > min_wall_delta:
+            regressions.append(f"{stage}: wall time {result['wall_s']:.3f}s vs baseline {previous['wall_s']:.3f}s")
+        if result['peak_rss_mb'] > previous['peak_rss_mb'] * (1 + tolerance):
+            # Peak RSS includes the interpreter and imports, so this only trips on substantial growth
+            regressions.append(f"{stage}: peak RSS {result['peak_rss_mb']:.1f} MB vs baseline {previous['peak_rss_mb']:.1f} MB")
+    return regressions
+
+
+def write_json(path, data):
+    """Atomically write a JSON file."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+    os.replace(temp_path, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark every pipeline stage on a synthetic locale corpus.')
+    parser.add_argument('--locales', type=int, default=30, help='Number of non-English locales (default: 30)')
+    parser.add_argument('--files', type=int, default=20, help='Namespace JSON files per locale (default: 20)')
+    parser.add_argument('--keys', type=int, default=300, help='Keys per namespace file (default: 300)')
+    parser.add_argument('--depth', type=int, default=3, help='Maximum key nesting depth (default: 3)')
+    parser.add_argument('--string-length', type=int, default=40, help='Approximate English string length (default: 40)')
+    parser.add_argument('--missing-ratio', type=float, default=0.1, help='Fraction of keys missing per locale (default: 0.1)')
+    parser.add_argument('--source-files', type=int, default=500, help="Source files generated for 'unused' mode (default: 500)")
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the corpus (default: 0)')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES), help='Stages to run (default: all)')
+    parser.add_argument('--jobs', type=int, default=1, help='Processes for compare and patch (default: 1)')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs per stage; the fastest is reported (default: 3)')
+    parser.add_argument('--workdir', help='Directory for the corpus and outputs (default: a temporary directory, removed afterwards)')
+    parser.add_argument('--results', default='benchmark_results.json', help='Where to write the results (default: benchmark_results.json)')
+    parser.add_argument('--baseline', help='Results file to compare against; exits with status 1 on a regression')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='Allowed slowdown or growth over the baseline (default: 0.2, i.e. 20%%)')
+    args = parser.parse_args()
+
+    config = {key: getattr(args, key) for key in
+              ('locales', 'files', 'keys', 'depth', 'string_length', 'missing_ratio', 'source_files', 'seed', 'jobs')}
+    workdir = args.workdir or tempfile.mkdtemp(prefix='i18n_benchmark_')
+    # Every stage starts cold: no locale snapshot is read or written
+    os.environ['I18N_SNAPSHOT_PATH'] = ''
+
+    try:
+        started = time.perf_counter()
+        paths = generate_corpus(workdir, args.locales, args.files, args.keys, args.depth, args.string_length,
+                                args.missing_ratio, args.source_files, seed=args.seed)
+        os.makedirs(paths['output_dir'], exist_ok=True)
+        print(f"Generated {paths['keys']} English keys x {args.locales} locales and {args.source_files} source files "
+              f"in {time.perf_counter() - started:.1f}s ({workdir})")
+
+        stages = [stage for stage in STAGES if stage in args.stages]
+        results = {
+            'config': config,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'stages': benchmark_stages(stages, paths, args.jobs, args.repeat),
+        }
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    write_json(args.results, results)
+    print(f"Results written to {args.results}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('config') != config:
+            print(f"Warning: Baseline {args.baseline} was recorded with a different corpus configuration")
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline}")
+
+
+if __name__ == "__main__":
+    main()
+
+# Example usage:
+# python i18n_benchmark.py --results benchmark_results.json
+# python i18n_benchmark.py --results new_results.json --baseline benchmark_results.json
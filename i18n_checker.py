@@ -2,76 +2,30 @@ import os
 import json
 import csv
 import argparse
-
-# Function to recursively find JSON files
-def find_json_files(base_directory):
-    json_files = []
-    for root, _, files in os.walk(base_directory):
-        for file in files:
-            if file.endswith(".json"):
-                json_files.append(os.path.join(root, file))
-    return json_files
-
-# Function to load a JSON file and return its content along with the file name
-def load_json(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f), os.path.basename(file_path)
-
-# Recursive function to extract all keys including nested ones as key paths, along with their file and value
-def extract_keys(data, json_file, parent_key=''):
-    keys = {}
-    for key, value in data.items():
-        full_key = f"{parent_key}.{key}" if parent_key else key
-        if isinstance(value, dict):
-            # If the value is a dict, recurse to extract nested keys
-            keys.update(extract_keys(value, json_file, full_key))
-        else:
-            # Otherwise, store the key, the file, and the value
-            keys[full_key] = (json_file, value)
-    return keys
+from concurrent.futures import ProcessPoolExecutor
+from i18n_key_scanner import scan_search_path
+from i18n_locale_tree import LocaleTreeLoader
+from i18n_metrics import add_metrics_arguments, instrumented_run, metrics
+from i18n_source_hashes import hash_source, load_source_hashes, save_source_hashes, sidecar_path, stale_keys
 
 # Function to load keys and values from all English JSON files
-def load_en_keys(en_json_files):
-    all_keys = {}
-    for json_file in en_json_files:
-        en_data, json_file_name = load_json(json_file)
-        all_keys.update(extract_keys(en_data, json_file_name))
-    return all_keys
+def load_en_keys(en_locale_path, loader):
+    return loader.load_locale_keys(en_locale_path)
 
 # Function to compare the English keys with other locale keys, considering identical values as missing
+# (both sides are already flattened {key: KeyEntry(json_file, value)} mappings)
 def compare_keys(en_data, other_locale_data):
-    # Extract nested keys from the English data
-    en_keys = extract_keys(en_data, "en.json")  # Provide a placeholder for json_file
-    # Extract nested keys from the locale data
-    other_keys = extract_keys(other_locale_data, "locale.json")  # Provide a placeholder for json_file
-
-    # Find keys that are missing or have the same value as in English
+    # Find keys that are missing or have the same value (in the same file) as in English
     missing_keys = {
-        key for key, (file, en_value) in en_keys.items()
-        if key not in other_keys or other_keys[key][1] == en_value
+        key for key, en_entry in en_data.items()
+        if key not in other_locale_data or other_locale_data[key] == en_entry
     }
 
     # Find extraneous keys that are present in the locale but not in English
-    extraneous_keys = {
-        key for key in other_keys.keys() - en_keys.keys()
-    }
+    extraneous_keys = other_locale_data.keys() - en_data.keys()
 
     return missing_keys, extraneous_keys
 
-# Function to search for keys in all files recursively under the search path
-def search_for_key_in_files(key, search_path):
-    for root, _, files in os.walk(search_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            try:
-                with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-                    contents = f.read()
-                    if key in contents:
-                        return True  # Key is found
-            except:
-                pass  # Skip unreadable files
-    return False  # Key not found
-
 # Function to write a CSV for English labels
 def write_english_labels_csv(en_data, output_file):
     with open(output_file, mode='w', newline='', encoding='utf-8') as file:
@@ -88,6 +42,8 @@ def write_consolidated_comparison_csv(comparison_data, output_file):
         for locale, data in comparison_data.items():
             for key, (json_file, _) in data['missing_keys']:  # Adjusted for file + value
                 writer.writerow([locale, "missing", key, json_file])
+            for key, (json_file, _) in data.get('stale_keys', []):  # Translated from English text that has since changed
+                writer.writerow([locale, "stale", key, json_file])
             for key, (json_file, _) in data['extraneous_keys']:  # Adjusted for file + value
                 writer.writerow([locale, "extraneous", key, json_file])
 
@@ -99,64 +55,202 @@ def write_unused_keys_to_csv(unused_keys, output_file):
         for key in unused_keys:
             writer.writerow([key])
 
+# Function to write the per-key hit count and first file it was found in
+def write_key_usage_to_csv(key_usage, output_file):
+    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.writer(file, quoting=csv.QUOTE_ALL)
+        writer.writerow(["label_key", "hit_count", "first_hit_file"])
+        for key, (hit_count, first_hit_file) in key_usage.items():
+            writer.writerow([key, hit_count, first_hit_file or ""])
+
 # Unused keys function
-def find_unused_keys(en_locale_path, search_base_path, output_dir):
-    en_json_files = find_json_files(en_locale_path)
-    all_en_keys = load_en_keys(en_json_files)
-    
-    unused_keys = []
-    for key in all_en_keys:
-        print(f"Searching for key: {key}")
-        if not search_for_key_in_files(key, search_base_path):
-            unused_keys.append(key)
+def find_unused_keys(en_locale_path, search_base_path, output_dir, write_key_usage=False, use_cache=True, refresh_cache=False,
+                     loader=None):
+    loader = loader or LocaleTreeLoader()
+    with metrics.span('load_english') as span:
+        all_en_keys = load_en_keys(en_locale_path, loader)
+        loader.save()
+        span['keys'] = len(all_en_keys)
+
+    # Read every changed source file once and match all keys at the same time
+    print(f"Searching {search_base_path} for {len(all_en_keys)} keys...")
+    cache_path = os.path.join(output_dir, '.unused_scan_cache.json') if use_cache else None
+    with metrics.span('scan_sources', keys=len(all_en_keys)):
+        key_usage = scan_search_path(all_en_keys, search_base_path, cache_path, refresh_cache)
+    unused_keys = [key for key in all_en_keys if key_usage[key][0] == 0]
 
     output_file = os.path.join(output_dir, 'unused_keys.csv')
     write_unused_keys_to_csv(unused_keys, output_file)
     print(f"Unused keys written to {output_file}")
 
-def compare_keys_in_locales(base_path, en_path, output_dir):
-    en_files = find_json_files(en_path)
-    all_en_data = {}
+    if write_key_usage:
+        key_usage_output_file = os.path.join(output_dir, 'key_usage.csv')
+        write_key_usage_to_csv(key_usage, key_usage_output_file)
+        print(f"Key usage written to {key_usage_output_file}")
+
+# Function to load the compare manifest, returning an empty one if it is missing or was built for other paths
+def load_compare_manifest(manifest_path, base_path, en_path):
+    empty_manifest = {'base_path': base_path, 'en_path': en_path, 'en_files': {}, 'results': {}}
+    if not manifest_path or not os.path.exists(manifest_path):
+        return empty_manifest
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return empty_manifest
+    if manifest.get('base_path') != base_path or manifest.get('en_path') != en_path:
+        return empty_manifest
+    return manifest
+
+# Function to atomically write the compare manifest
+def save_compare_manifest(manifest_path, manifest):
+    temp_path = f"{manifest_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(temp_path, manifest_path)
+
+# Function to diff one locale against English, skipping the comparison if neither side nor its source hashes changed.
+# Returns (file hashes, compact missing/stale/extraneous result or None if the previous result still holds)
+def diff_locale(loader, locale_path, all_en_data, previous, en_changed, locale_hashes=None):
+    locale_hashes = locale_hashes or {}
+    hashes_digest = hash_source(locale_hashes)
+    locale_files = loader.file_hashes(locale_path)
+    if (not en_changed and previous is not None and previous['files'] == locale_files
+            and previous.get('source_hashes') == hashes_digest):
+        return locale_files, None
+
+    # Load and unnest locale JSON files into key-value pairs with their files
+    locale_data = loader.load_locale_keys(locale_path)
+
+    # Compare the fully unpacked keys, treating identical values as missing
+    missing_keys, extraneous_keys = compare_keys(all_en_data, locale_data)
+
+    # Translations whose English source changed since they were made
+    stale = stale_keys(all_en_data, locale_data, locale_hashes, missing_keys)
+
+    # Associate missing/stale/extraneous keys with their respective JSON files, in a stable order
+    return locale_files, {
+        'files': locale_files,
+        'source_hashes': hashes_digest,
+        'missing_keys': [[key, all_en_data[key].json_file] for key in all_en_data if key in missing_keys],
+        'stale_keys': [[key, all_en_data[key].json_file] for key in all_en_data if key in stale],
+        'extraneous_keys': [[key, locale_data[key].json_file] for key in locale_data if key in extraneous_keys],
+    }
+
+# Function to record the current English text as the source of every existing translation that has no source hash
+# yet, so that later English edits are detected as stale
+def baseline_source_hashes(loader, base_path, all_en_data, locales, source_hashes, source_hashes_path):
+    recorded = 0
+    for locale in locales:
+        locale_data = loader.load_locale_keys(os.path.join(base_path, locale))
+        missing_keys, _ = compare_keys(all_en_data, locale_data)
+        locale_hashes = source_hashes.setdefault(locale, {})
+        for key, en_entry in all_en_data.items():
+            if key in locale_data and key not in missing_keys and key not in locale_hashes:
+                locale_hashes[key] = hash_source(en_entry.value)
+                recorded += 1
+    save_source_hashes(source_hashes_path, source_hashes)
+    print(f"Recorded English source hashes for {recorded} existing translations.")
+
+# English keys shared with every worker process once, instead of once per locale
+_worker_en_data = None
+
+def _init_diff_worker(all_en_data):
+    global _worker_en_data
+    _worker_en_data = all_en_data
+
+# Process pool worker: diff a locale with a loader seeded from the parent's snapshot entries.
+# Returns the compact result plus snapshot entries only for the files this worker had to re-parse
+def _diff_locale_worker(locale_path, previous, en_changed, cached_entries, locale_hashes):
+    loader = LocaleTreeLoader(snapshot_path=None)
+    loader.entries = dict(cached_entries)
+    locale_files, result = diff_locale(loader, locale_path, _worker_en_data, previous, en_changed, locale_hashes)
+    changed_entries = {path: entry for path, entry in loader.entries.items() if cached_entries.get(path) is not entry}
+    return locale_files, result, changed_entries
+
+# Function to diff every locale against English. Writes english_labels.csv and the consolidated comparison CSV
+# unless write_csv is False, and returns the English keys and the per-locale results for in-memory callers
+def compare_keys_in_locales(base_path, en_path, output_dir, use_manifest=True, refresh_manifest=False, loader=None, jobs=1,
+                            write_csv=True, baseline_hashes=False, source_hashes_path=None):
+    loader = loader or LocaleTreeLoader()
+    manifest_path = os.path.join(output_dir, '.compare_manifest.json') if use_manifest else None
+    manifest = load_compare_manifest(None if refresh_manifest else manifest_path,
+                                     os.path.abspath(base_path), os.path.abspath(en_path))
 
     # Load and unnest English JSON files into key-value pairs with their files
-    for en_file in en_files:
-        en_data, json_file = load_json(en_file)
-        all_en_data.update(extract_keys(en_data, json_file))  # Track file with key
+    with metrics.span('load_english') as span:
+        all_en_data = load_en_keys(en_path, loader)
+        en_files = loader.file_hashes(en_path)
+        en_changed = manifest['en_files'] != en_files
+        span['keys'] = len(all_en_data)
 
     # Write English labels to CSV
     english_labels_output_file = os.path.join(output_dir, 'english_labels.csv')
-    write_english_labels_csv(all_en_data, english_labels_output_file)
+    if write_csv and (en_changed or not os.path.exists(english_labels_output_file)):
+        write_english_labels_csv(all_en_data, english_labels_output_file)
 
-    comparison_data = {}
-    other_locales = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d)) and d != 'en']
+    other_locales = loader.list_locales(base_path)
+    locale_paths = [os.path.join(base_path, locale) for locale in other_locales]
+    previous_results = [manifest['results'].get(locale) for locale in other_locales]
+    source_hashes_path = source_hashes_path or sidecar_path(base_path)
+    source_hashes = load_source_hashes(source_hashes_path)
+    if baseline_hashes:
+        baseline_source_hashes(loader, base_path, all_en_data, other_locales, source_hashes, source_hashes_path)
+    locale_hashes = [source_hashes.get(locale, {}) for locale in other_locales]
     print(f"Comparing English keys with {len(other_locales)} other locales.")
 
-    for locale in other_locales:
-        locale_path = os.path.join(base_path, locale)
-        locale_files = find_json_files(locale_path)
-        locale_data = {}
-
-        # Load and unnest locale JSON files into key-value pairs with their files
-        for locale_file in locale_files:
-            locale_json_data, json_file = load_json(locale_file)
-            locale_data.update(extract_keys(locale_json_data, json_file))  # Track file with key
+    # Load and diff the locales, fanned out across a process pool if requested
+    with metrics.span('diff_locales', keys=len(all_en_data) * len(other_locales), locales=len(other_locales), jobs=jobs):
+        if jobs > 1 and len(other_locales) > 1:
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_diff_worker, initargs=(all_en_data,)) as executor:
+                diffs = list(executor.map(
+                    _diff_locale_worker, locale_paths, previous_results, [en_changed] * len(locale_paths),
+                    [loader.entries_under(locale_path) for locale_path in locale_paths], locale_hashes
+                ))
+            for _, _, changed_entries in diffs:
+                loader.entries.update(changed_entries)
+                loader.dirty = loader.dirty or bool(changed_entries)
+        else:
+            diffs = [diff_locale(loader, locale_path, all_en_data, previous, en_changed, hashes) + ({},)
+                     for locale_path, previous, hashes in zip(locale_paths, previous_results, locale_hashes)]
 
-        # Compare the fully unpacked keys, treating identical values as missing
-        missing_keys, extraneous_keys = compare_keys(all_en_data, locale_data)
+    # Collect the results in locale order so the CSV is deterministic
+    results = {}
+    rediffed_locales = []
+    for locale, previous, (_, result, _) in zip(other_locales, previous_results, diffs):
+        if result is None:
+            results[locale] = previous
+        else:
+            results[locale] = result
+            rediffed_locales.append(locale)
 
-        # Associate missing/extraneous keys with their respective JSON files
-        missing_keys_with_file = [(key, all_en_data[key]) for key in missing_keys]
-        extraneous_keys_with_file = [(key, locale_data[key]) for key in extraneous_keys]
+    loader.save()
+    metrics.count('locale_files_parsed', loader.parsed)
+    metrics.count('locale_files_reused', loader.reused)
+    metrics.count('locales_rediffed', len(rediffed_locales))
+    print(f"Re-diffed {len(rediffed_locales)} of {len(other_locales)} locales.")
 
-        comparison_data[locale] = {
-            'missing_keys': missing_keys_with_file,
-            'extraneous_keys': extraneous_keys_with_file
+    # Write comparison results to a consolidated CSV file, unless nothing changed since the last run
+    consolidated_output_file = os.path.join(output_dir, 'locale_key_comparison_consolidated.csv')
+    if write_csv and (results != manifest['results'] or not os.path.exists(consolidated_output_file)):
+        comparison_data = {
+            locale: {
+                'missing_keys': [(key, (json_file, None)) for key, json_file in result['missing_keys']],
+                'stale_keys': [(key, (json_file, None)) for key, json_file in result.get('stale_keys', [])],
+                'extraneous_keys': [(key, (json_file, None)) for key, json_file in result['extraneous_keys']],
+            }
+            for locale, result in results.items()
         }
+        write_consolidated_comparison_csv(comparison_data, consolidated_output_file)
+        print(f"Comparison CSV written to {consolidated_output_file}")
+    elif write_csv:
+        print(f"Comparison CSV {consolidated_output_file} is up to date")
 
-    # Write comparison results to a consolidated CSV file
-    consolidated_output_file = os.path.join(output_dir, 'locale_key_comparison_consolidated.csv')
-    write_consolidated_comparison_csv(comparison_data, consolidated_output_file)
-    print(f"Comparison CSV written to {consolidated_output_file}")
+    if manifest_path:
+        manifest.update({'en_files': en_files, 'results': results})
+        save_compare_manifest(manifest_path, manifest)
+
+    return all_en_data, results
 
 # Main function to parse arguments and invoke appropriate functions
 def main():
@@ -166,16 +260,29 @@ def main():
     parser.add_argument("--base-path", required=True, help="Base path for all locales (for comparison).")
     parser.add_argument("--output-dir", required=True, help="Directory to store the output CSV files.")
     parser.add_argument("--search-path", required=False, help="Path to search for unused keys (required for 'unused' mode).")
+    parser.add_argument("--key-usage", action="store_true", help="Also write key_usage.csv with the hit count and first-hit file of every key ('unused' mode).")
+    parser.add_argument("--no-scan-cache", action="store_true", help="Do not read or write the source scan cache in the output directory ('unused' mode).")
+    parser.add_argument("--refresh-cache", action="store_true", help="Ignore the existing source scan cache or compare manifest and rebuild it from scratch.")
+    parser.add_argument("--no-manifest", action="store_true", help="Do not read or write the compare manifest in the output directory ('compare' mode).")
+    parser.add_argument("--baseline-source-hashes", action="store_true", help="Record the current English text as the source of existing translations that have no source hash yet, so later English edits are reported as 'stale' ('compare' mode).")
+    parser.add_argument("--source-hashes", help="English source hash sidecar used to detect stale translations ('compare' mode, default: <base-path>/.i18n_source_hashes.json).")
+    parser.add_argument("--jobs", type=int, default=1, help="Number of processes used to load and diff locales in parallel ('compare' mode, default: 1).")
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
 
-    if args.mode == "compare":
-        compare_keys_in_locales(args.base_path, args.en_locale_path, args.output_dir)
-    elif args.mode == "unused":
-        if not args.search_path:
-            print("Error: --search-path is required for 'unused' mode.")
-            return
-        find_unused_keys(args.en_locale_path, args.search_path, args.output_dir)
+    if args.mode == "unused" and not args.search_path:
+        print("Error: --search-path is required for 'unused' mode.")
+        return
+
+    with instrumented_run(f"i18n_checker_{args.mode}", args.output_dir, args):
+        if args.mode == "compare":
+            compare_keys_in_locales(args.base_path, args.en_locale_path, args.output_dir,
+                                    use_manifest=not args.no_manifest, refresh_manifest=args.refresh_cache, jobs=args.jobs,
+                                    baseline_hashes=args.baseline_source_hashes, source_hashes_path=args.source_hashes)
+        elif args.mode == "unused":
+            find_unused_keys(args.en_locale_path, args.search_path, args.output_dir, args.key_usage,
+                             use_cache=not args.no_scan_cache, refresh_cache=args.refresh_cache)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,76 @@
+import os
+import json
+
+JOURNAL_NAME = 'translation_journal.jsonl'
+
+
+class TranslationJournal:
+    """Append-only JSONL record of translations, written as soon as each request completes.
+
+    Every line is one translation ({"key", "en", "translated_value", "locale"}). Lines are flushed and fsynced
+    after each request, so a crash or Ctrl-C loses at most the requests still in flight, and a run started
+    with resume=True skips everything already recorded.
+    """
+
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.entries = self.load() if resume else {}
+        self.resumed = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        needs_newline = resume and self.ends_mid_line()
+        self.file = open(path, 'a' if resume else 'w', encoding='utf-8')
+        if needs_newline:
+            # Finish the line a crash cut short so the next entry starts on its own line
+            self.file.write("\n")
+
+    def load(self):
+        """Read {(locale, key): translation} from an existing journal, skipping lines cut short by a crash."""
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    translation = json.loads(line)
+                    entries[(translation['locale'], translation['key'])] = translation
+                except (ValueError, KeyError, TypeError):
+                    print(f"Warning: Skipping unreadable line {line_number} of {self.path}")
+        return entries
+
+    def ends_mid_line(self):
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return False
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b"\n"
+
+    def lookup(self, translation_list, locale):
+        """Split a locale's phrases into (journaled translations, phrases still to translate).
+
+        A journaled translation is only reused while its English text is unchanged.
+        """
+        journaled, remaining = [], []
+        for item in translation_list:
+            translation = self.entries.get((locale, item['label_key']))
+            if translation is not None and translation['en'] == item['value']:
+                journaled.append(translation)
+            else:
+                remaining.append(item)
+        self.resumed += len(journaled)
+        return journaled, remaining
+
+    def append(self, translations):
+        """Record the translations of one completed request and force them to disk."""
+        if not translations:
+            return
+        for translation in translations:
+            self.file.write(json.dumps(translation, ensure_ascii=False) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        self.file.close()
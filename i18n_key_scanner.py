@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+from collections import deque
+
+try:
+    import ahocorasick  # Optional C implementation (pyahocorasick)
+except ImportError:
+    ahocorasick = None
+
+
+class KeyAutomaton:
+    """Aho-Corasick automaton that finds every occurrence of every key in a single pass over a text."""
+
+    def __init__(self, keys):
+        self.keys = list(dict.fromkeys(keys))
+        if ahocorasick is not None:
+            self._automaton = ahocorasick.Automaton()
+            for index, key in enumerate(self.keys):
+                self._automaton.add_word(key, index)
+            if self.keys:
+                self._automaton.make_automaton()
+        else:
+            self._automaton = None
+            self._build(self.keys)
+
+    def _build(self, keys):
+        """Build the goto/fail/output tables of the pure-Python automaton."""
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+
+        for index, key in enumerate(keys):
+            state = 0
+            for char in key:
+                next_state = self._goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][char] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] += (index,)
+
+        # Breadth-first pass to compute failure links and merge outputs of suffix states
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[next_state] = self._goto[fallback].get(char, 0)
+                self._output[next_state] += self._output[self._fail[next_state]]
+
+    def count_matches(self, text):
+        """Return a dict of key -> number of (possibly overlapping) occurrences in the text."""
+        counts = {}
+        if not self.keys:
+            return counts
+
+        if self._automaton is not None:
+            for _, index in self._automaton.iter(text):
+                counts[index] = counts.get(index, 0) + 1
+        else:
+            goto, fail, output = self._goto, self._fail, self._output
+            state = 0
+            for char in text:
+                while state and char not in goto[state]:
+                    state = fail[state]
+                state = goto[state].get(char, 0)
+                for index in output[state]:
+                    counts[index] = counts.get(index, 0) + 1
+
+        return {self.keys[index]: count for index, count in counts.items()}
+
+
+def iter_source_files(search_path):
+    """Walk the search path in a stable order and yield every file path."""
+    for root, dirs, files in os.walk(search_path):
+        dirs.sort()
+        for file in sorted(files):
+            yield os.path.join(root, file)
+
+
+def read_source_file(file_path):
+    """Read a source file as bytes, or return None if it is unreadable."""
+    try:
+        with open(file_path, 'rb') as f:
+            return f.read()
+    except OSError:
+        return None  # Skip unreadable files
+
+
+def load_scan_cache(cache_path):
+    """Load the per-file hit cache as (keys it covers, files), returning an empty one if it is missing or unreadable."""
+    if not cache_path or not os.path.exists(cache_path):
+        return set(), {}
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+    except (OSError, ValueError):
+        return set(), {}
+    if not isinstance(cache.get('keys'), list):
+        return set(), {}  # Written by an older version
+    return set(cache['keys']), cache.get('files', {})
+
+
+def save_scan_cache(cache_path, keys, files):
+    """Atomically write the per-file hit cache, recording the keys its hits cover."""
+    temp_path = f"{cache_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump({'keys': sorted(keys), 'files': files}, f, ensure_ascii=False)
+    os.replace(temp_path, cache_path)
+
+
+def scan_search_path(keys, search_path, cache_path=None, refresh_cache=False):
+    """Scan every file under the search path once, matching all keys at the same time.
+
+    When a cache path is given, files whose mtime and size (or, failing that, content hash) match the
+    cached entry are not rescanned; their cached hits are merged with the hits of the changed files.
+    Keys the cache does not cover yet are searched for in the unchanged files on their own, so adding
+    keys does not invalidate the cached hits of the others.
+
+    Returns a dict of key -> (hit_count, first_hit_file) for every key, with (0, None) for keys that were never found.
+    """
+    automaton = KeyAutomaton(keys)
+    usage = {key: (0, None) for key in automaton.keys}
+    cached_keys, cached_files = (set(), {}) if refresh_cache else load_scan_cache(cache_path)
+    new_keys = [key for key in automaton.keys if key not in cached_keys]
+    new_key_automaton = KeyAutomaton(new_keys) if new_keys and cached_files else None
+    scanned_files = {}
+    rescanned = 0
+    searched_for_new_keys = 0
+
+    for file_path in iter_source_files(search_path):
+        cache_key = os.path.abspath(file_path)
+        entry = cached_files.get(cache_key)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue
+
+        contents = None
+        unchanged = entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size
+        if not unchanged:
+            contents = read_source_file(file_path)
+            if contents is None:
+                continue
+            content_hash = hashlib.sha256(contents).hexdigest()
+            unchanged = entry and entry['sha256'] == content_hash  # Touched but unchanged
+            entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': content_hash,
+                     'hits': entry['hits'] if unchanged else {}}
+
+        if unchanged:
+            # Keep the hits of keys still in use and add those of keys the cache has not seen
+            hits = {key: count for key, count in entry['hits'].items() if key in usage}
+            if new_key_automaton is not None:
+                contents = contents if contents is not None else read_source_file(file_path)
+                if contents is None:
+                    continue
+                hits.update(new_key_automaton.count_matches(contents.decode('utf-8', errors='ignore')))
+                searched_for_new_keys += 1
+        else:
+            hits = automaton.count_matches(contents.decode('utf-8', errors='ignore'))
+            rescanned += 1
+        entry['hits'] = hits
+        scanned_files[cache_key] = entry
+
+        for key, count in hits.items():
+            hit_count, first_hit_file = usage[key]
+            usage[key] = (hit_count + count, first_hit_file or file_path)
+
+    if cache_path:
+        save_scan_cache(cache_path, automaton.keys, scanned_files)
+        print(f"Rescanned {rescanned} of {len(scanned_files)} source files ({len(scanned_files) - rescanned} from cache"
+              + (f", {searched_for_new_keys} searched for {len(new_keys)} new keys only" if searched_for_new_keys else "")
+              + ")")
+
+    return usage
@@ -0,0 +1,149 @@
+import io
+import os
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import urllib.request
+from i18n_metrics import metrics
+from i18n_mock_server import add_server_arguments, start_server, state_from_args
+from i18n_rate_control import DEFAULT_MAX_RETRIES, RateController
+from i18n_translator import (DEFAULT_MAX_INPUT_TOKENS, DEFAULT_MAX_OUTPUT_TOKENS, configure_api_endpoint,
+                             load_csv_files, process_missing_translations)
+
+
+def percentile(values, fraction):
+    """Return the value below which the given fraction of values fall (nearest rank)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)]
+
+
+def server_stats(base_url):
+    """Fetch the mock server's per-outcome request counts."""
+    with urllib.request.urlopen(f"{base_url.rstrip('/')}/mock/stats") as response:
+        return json.load(response)
+
+
+def run_load_test(english_labels_df, locale_key_comparison_df, concurrency, max_input_tokens, max_output_tokens,
+                  base_url, max_retries=DEFAULT_MAX_RETRIES, dedupe=True, locales_per_request=1, verbose=False):
+    """Translate the corpus through the endpoint at base_url and return throughput and latency figures."""
+    metrics.reset('i18n_loadtest')
+    controller = RateController(concurrency, max_retries=max_retries)
+    configure_api_endpoint(base_url)
+    requested = int(locale_key_comparison_df['status'].isin(['missing', 'stale']).sum())
+    output = io.StringIO()
+
+    with tempfile.TemporaryDirectory() as output_dir:
+        with contextlib.redirect_stdout(None if verbose else output):
+            started = time.perf_counter()
+            translations = process_missing_translations(english_labels_df, locale_key_comparison_df.copy(), concurrency,
+                                                        max_input_tokens, max_output_tokens, output_dir=output_dir,
+                                                        rate_controller=controller, dedupe=dedupe,
+                                                        locales_per_request=locales_per_request)
+            elapsed = time.perf_counter() - started
+
+    calls = [event for event in metrics.events if event['type'] == 'api_call']
+    latencies = [event['duration_s'] for event in calls if event['status'] == 'ok']
+    statuses = {}
+    for event in calls:
+        statuses[event['status']] = statuses.get(event['status'], 0) + 1
+
+    return {
+        'concurrency': concurrency,
+        'elapsed_s': round(elapsed, 3),
+        'requests': len(calls),
+        'requests_per_s': round(len(calls) / elapsed, 2) if elapsed > 0 else None,
+        'phrases_requested': requested,
+        'phrases_translated': len(translations),
+        'phrases_per_s': round(len(translations) / elapsed, 1) if elapsed > 0 else None,
+        'latency_p50_s': percentile(latencies, 0.5),
+        'latency_p95_s': percentile(latencies, 0.95),
+        'statuses': statuses,
+        'prompt_tokens': sum(event['prompt_tokens'] or 0 for event in calls),
+        'completion_tokens': sum(event['completion_tokens'] or 0 for event in calls),
+        'http_requests': controller.stats['requests'],
+        'rate_limited': controller.stats['rate_limited'],
+        'budget_wait_s': round(controller.stats['waited_s'], 3),
+        'final_concurrency': round(controller.limit, 2),
+    }
+
+
+def format_report(results):
+    """Render the load test results as a plain-text table, one row per concurrency level."""
+    lines = [f"{'concurrency':>11} {'elapsed s':>10} {'requests':>9} {'req/s':>7} {'phrases':>15} {'phrases/s':>10} "
+             f"{'p50 s':>7} {'p95 s':>7} {'http':>6} {'429s':>5} {'window':>7}  outcomes"]
+    for result in results:
+        phrases = f"{result['phrases_translated']}/{result['phrases_requested']}"
+        p50 = f"{result['latency_p50_s']:.3f}" if result['latency_p50_s'] is not None else '-'
+        p95 = f"{result['latency_p95_s']:.3f}" if result['latency_p95_s'] is not None else '-'
+        outcomes = ', '.join(f"{count} {status}" for status, count in sorted(result['statuses'].items()))
+        if 'server' in result:
+            outcomes += ' | server: ' + ', '.join(f"{count} {outcome}" for outcome, count in sorted(result['server'].items()))
+        lines.append(f"{result['concurrency']:>11} {result['elapsed_s']:>10.3f} {result['requests']:>9} "
+                     f"{result['requests_per_s'] or 0:>7.2f} {phrases:>15} {result['phrases_per_s'] or 0:>10.1f} "
+                     f"{p50:>7} {p95:>7} {result['http_requests']:>6} {result['rate_limited']:>5} "
+                     f"{result['final_concurrency']:>7}  {outcomes}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the translator against the local mock server (or another endpoint).')
+    parser.add_argument('--input-dir', default='locale_comparison',
+                        help='Directory with english_labels.csv and locale_key_comparison_consolidated.csv from i18n_checker.py (default: locale_comparison)')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1],
+                        help='Concurrency levels to test, one run each (default: 1)')
+    parser.add_argument('--max-input-tokens', type=int, default=DEFAULT_MAX_INPUT_TOKENS,
+                        help=f'Estimated input token budget per translation request (default: {DEFAULT_MAX_INPUT_TOKENS})')
+    parser.add_argument('--max-output-tokens', type=int, default=DEFAULT_MAX_OUTPUT_TOKENS,
+                        help=f'Estimated output token budget per translation request (default: {DEFAULT_MAX_OUTPUT_TOKENS})')
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                        help=f'Retries per request after a 429, 5xx or connection error (default: {DEFAULT_MAX_RETRIES})')
+    parser.add_argument('--no-dedupe', action='store_true',
+                        help='Translate every key separately instead of once per distinct English text in each locale')
+    parser.add_argument('--locales-per-request', type=int, default=1,
+                        help='Ask for up to this many target locales in one request (default: 1)')
+    parser.add_argument('--base-url', default=None,
+                        help='Test an already running endpoint instead of starting a mock server; the server options are then ignored')
+    parser.add_argument('--results', help='Also write the results as JSON to this file')
+    parser.add_argument('--verbose', action='store_true', help="Show the translator's own output")
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    english_labels_df, locale_key_comparison_df = load_csv_files(
+        os.path.join(args.input_dir, 'english_labels.csv'),
+        os.path.join(args.input_dir, 'locale_key_comparison_consolidated.csv'))
+
+    results = []
+    for concurrency in args.concurrency:
+        # A fresh mock server per run, so rate limit windows and outcome counts do not carry over
+        server = None if args.base_url else start_server('127.0.0.1', 0, state_from_args(args))
+        base_url = args.base_url or f"http://127.0.0.1:{server.server_port}/v1"
+        try:
+            result = run_load_test(english_labels_df, locale_key_comparison_df, concurrency, args.max_input_tokens,
+                                   args.max_output_tokens, base_url, args.max_retries, not args.no_dedupe,
+                                   args.locales_per_request, args.verbose)
+            if server:
+                result['server'] = server_stats(base_url)
+        finally:
+            if server:
+                server.shutdown()
+                server.server_close()
+        results.append(result)
+        print(f"Concurrency {concurrency}: {result['requests']} requests in {result['elapsed_s']:.2f}s "
+              f"({result['requests_per_s']} req/s)")
+
+    print(f"\n{format_report(results)}")
+    if args.results:
+        with open(args.results, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"Results written to {args.results}")
+
+
+if __name__ == "__main__":
+    main()
+
+# Example usage:
+# python i18n_loadtest.py --input-dir locale_comparison --concurrency 1 4 16 --latency-ms 800 --latency-distribution lognormal --rate-limit-rate 0.05 --tpm 200000
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import pickle
+import hashlib
+
+try:
+    import orjson  # Optional, much faster JSON parser
+except ImportError:
+    orjson = None
+
+# Parsed locale files are kept in a binary snapshot so each tool in the pipeline does not have to
+# re-parse the same JSON. Set I18N_SNAPSHOT_PATH to another file, or to an empty string to disable it.
+DEFAULT_SNAPSHOT_PATH = os.environ.get('I18N_SNAPSHOT_PATH', os.path.join('.i18n_cache', 'locale_tree.pickle'))
+SNAPSHOT_VERSION = 1
+
+
+def find_json_files(base_directory):
+    """Recursively find all JSON files in the specified directory."""
+    json_files = []
+    for root, _, files in os.walk(base_directory):
+        for file in files:
+            if file.endswith(".json"):
+                json_files.append(os.path.join(root, file))
+    return json_files
+
+
+def parse_json(contents):
+    """Parse JSON bytes, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.loads(contents)
+    return json.loads(contents)
+
+
+class KeyEntry:
+    """Compact (json_file, value) record for a flattened key; unpacks, indexes and compares like the tuple it replaces."""
+
+    __slots__ = ('json_file', 'value')
+
+    def __init__(self, json_file, value):
+        self.json_file = json_file
+        self.value = value
+
+    def __iter__(self):
+        yield self.json_file
+        yield self.value
+
+    def __getitem__(self, index):
+        return (self.json_file, self.value)[index]
+
+    def __eq__(self, other):
+        if isinstance(other, KeyEntry):
+            return self.json_file == other.json_file and self.value == other.value
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self.json_file, self.value))
+
+    def __reduce__(self):
+        return KeyEntry, (self.json_file, self.value)
+
+    def __repr__(self):
+        return f"KeyEntry({self.json_file!r}, {self.value!r})"
+
+
+def flatten_keys(data, parent_key=''):
+    """Flatten nested JSON into a dict of dotted key paths to leaf values.
+
+    Walks the JSON with an explicit stack of item iterators. Keys come out in document order, as with a
+    recursive walk, and are interned so that locales sharing a key share one string for it.
+    """
+    keys = {}
+    intern = sys.intern
+    stack = [(f"{parent_key}." if parent_key else '', iter(data.items()))]
+    while stack:
+        prefix, items = stack[-1]
+        for key, value in items:
+            if isinstance(value, dict):
+                stack.append((f"{prefix}{key}.", iter(value.items())))
+                break
+            keys[intern(prefix + key)] = value
+        else:
+            stack.pop()
+    return keys
+
+
+class LocaleTreeLoader:
+    """Loads locale directories into {locale: {json_file: {key: value}}}, reusing a parsed snapshot.
+
+    Snapshot entries are keyed by absolute file path and reused while the file's mtime and size are
+    unchanged (or, if only the mtime moved, while its content hash is unchanged).
+    """
+
+    def __init__(self, snapshot_path=DEFAULT_SNAPSHOT_PATH):
+        self.snapshot_path = snapshot_path
+        self.entries = self._read_snapshot()
+        self.dirty = False
+        self.parsed = 0
+        self.reused = 0
+
+    def _read_snapshot(self):
+        if not self.snapshot_path or not os.path.exists(self.snapshot_path):
+            return {}
+        try:
+            with open(self.snapshot_path, 'rb') as f:
+                snapshot = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return {}
+        if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+            return {}
+        return snapshot['files']
+
+    def load_file(self, file_path):
+        """Return the snapshot entry for a JSON file: mtime_ns, size, sha256, json_file and flattened keys."""
+        cache_key = os.path.abspath(file_path)
+        entry = self.entries.get(cache_key)
+        stat = os.stat(file_path)
+        if entry and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+            self.reused += 1
+            return entry
+
+        with open(file_path, 'rb') as f:
+            contents = f.read()
+        content_hash = hashlib.sha256(contents).hexdigest()
+        if entry and entry['sha256'] == content_hash:
+            keys = entry['keys']
+            self.reused += 1
+        else:
+            keys = flatten_keys(parse_json(contents))
+            self.parsed += 1
+
+        entry = {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': content_hash,
+                 'json_file': sys.intern(os.path.basename(file_path)), 'keys': keys}
+        self.entries[cache_key] = entry
+        self.dirty = True
+        return entry
+
+    def entries_under(self, directory):
+        """Return the snapshot entries for files below a directory, e.g. to seed a worker's loader."""
+        prefix = os.path.join(os.path.abspath(directory), '')
+        return {path: entry for path, entry in self.entries.items() if path.startswith(prefix)}
+
+    def load_locale(self, locale_path):
+        """Load every JSON file of one locale directory into {json_file: {key: value}}.
+
+        The flattened key dicts are shared with the snapshot and must not be modified.
+        """
+        files = {}
+        for file_path in find_json_files(locale_path):
+            entry = self.load_file(file_path)
+            json_file = sys.intern(entry['json_file'])
+            if json_file in files:
+                # Two files with the same name in one locale are merged, as the tools always did
+                files[json_file] = {**files[json_file], **entry['keys']}
+            else:
+                files[json_file] = entry['keys']
+        return files
+
+    def load_locale_keys(self, locale_path):
+        """Load one locale directory as a flat {key: KeyEntry(json_file, value)} mapping."""
+        keys = {}
+        for json_file, file_keys in self.load_locale(locale_path).items():
+            keys.update((key, KeyEntry(json_file, value)) for key, value in file_keys.items())
+        return keys
+
+    def file_hashes(self, locale_path):
+        """Return {absolute file path: sha256} for every JSON file of a locale directory."""
+        return {os.path.abspath(file_path): self.load_file(file_path)['sha256'] for file_path in find_json_files(locale_path)}
+
+    def list_locales(self, base_path, exclude=('en',)):
+        """Return the sorted locale directory names under base_path."""
+        return sorted(d for d in os.listdir(base_path)
+                      if os.path.isdir(os.path.join(base_path, d)) and d not in exclude)
+
+    def load_tree(self, base_path, exclude=('en',)):
+        """Load every locale under base_path into {locale: {json_file: {key: value}}}."""
+        return {locale: self.load_locale(os.path.join(base_path, locale)) for locale in self.list_locales(base_path, exclude)}
+
+    def save(self):
+        """Write the snapshot if anything was parsed, dropping entries for files that no longer exist."""
+        if not self.snapshot_path or not self.dirty:
+            return
+        self.entries = {path: entry for path, entry in self.entries.items() if os.path.exists(path)}
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = f"{self.snapshot_path}.tmp"
+        with open(temp_path, 'wb') as f:
+            pickle.dump({'version': SNAPSHOT_VERSION, 'files': self.entries}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, self.snapshot_path)
+        self.dirty = False
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import uuid
+import pstats
+import cProfile
+import contextlib
+
+PROFILE_TOP_FUNCTIONS = 25
+
+
+class Metrics:
+    """Collects timing spans, API calls and counters for one run of a tool, written out as JSONL."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self, tool=None):
+        self.run_id = uuid.uuid4().hex[:12]
+        self.tool = tool
+        self.events = []
+        self.counters = {}
+
+    @contextlib.contextmanager
+    def span(self, name, **fields):
+        """Time a block. The yielded dict can be filled in with more fields, e.g. keys for a keys/s rate."""
+        started = time.perf_counter()
+        try:
+            yield fields
+        finally:
+            duration = time.perf_counter() - started
+            event = {'type': 'span', 'name': name, 'duration_s': round(duration, 6), **fields}
+            if fields.get('keys') and duration > 0:
+                event['keys_per_s'] = round(fields['keys'] / duration, 1)
+            self.events.append(event)
+
+    def api_call(self, locale, items, duration_s=None, usage=None, status='ok', attempt=1, mode='sync'):
+        """Record one translation request with its latency and the token counts from response.usage."""
+        event = {'type': 'api_call', 'locale': locale, 'items': items, 'status': status, 'attempt': attempt, 'mode': mode,
+                 'duration_s': round(duration_s, 6) if duration_s is not None else None}
+        for field in ('prompt_tokens', 'completion_tokens', 'total_tokens'):
+            value = usage.get(field) if isinstance(usage, dict) else getattr(usage, field, None)
+            event[field] = value if isinstance(value, int) else None
+        self.events.append(event)
+
+    def count(self, name, value=1):
+        """Add to a named counter, e.g. files read or written."""
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def summary(self):
+        """Aggregate the events into per-span and per-locale totals."""
+        spans = {}
+        for event in self.events:
+            if event['type'] != 'span':
+                continue
+            span = spans.setdefault(event['name'], {'count': 0, 'total_s': 0.0, 'keys': 0})
+            span['count'] += 1
+            span['total_s'] += event['duration_s']
+            span['keys'] += event.get('keys') or 0
+
+        locales = {}
+        for event in self.events:
+            if event['type'] != 'api_call':
+                continue
+            locale = locales.setdefault(event['locale'], {'calls': 0, 'errors': 0, 'retries': 0, 'items': 0, 'total_s': 0.0,
+                                                          'prompt_tokens': 0, 'completion_tokens': 0})
+            locale['calls'] += 1
+            locale['errors'] += event['status'] != 'ok'
+            locale['retries'] += event['attempt'] > 1
+            locale['items'] += event['items']
+            locale['total_s'] += event['duration_s'] or 0
+            locale['prompt_tokens'] += event['prompt_tokens'] or 0
+            locale['completion_tokens'] += event['completion_tokens'] or 0
+
+        return {'spans': spans, 'api_calls': locales, 'counters': dict(self.counters)}
+
+    def write(self, path):
+        """Append this run's events and its summary to a JSONL file."""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+        with open(path, 'a', encoding='utf-8') as f:
+            for event in self.events + [{'type': 'summary', **self.summary()}]:
+                f.write(json.dumps({'run_id': self.run_id, 'tool': self.tool, 'ts': timestamp, **event}, ensure_ascii=False) + "\n")
+
+    def summary_table(self):
+        """Render the summary as plain-text tables for the end of a run."""
+        summary = self.summary()
+        lines = [f"{'stage':<32} {'count':>6} {'total s':>9} {'keys/s':>11}"]
+        for name, span in summary['spans'].items():
+            rate = f"{span['keys'] / span['total_s']:.0f}" if span['keys'] and span['total_s'] > 0 else ''
+            lines.append(f"{name:<32} {span['count']:>6} {span['total_s']:>9.3f} {rate:>11}")
+
+        if summary['api_calls']:
+            lines.append("")
+            lines.append(f"{'locale':<10} {'calls':>6} {'errors':>7} {'retries':>8} {'items':>7} {'mean s':>8} "
+                         f"{'prompt tok':>11} {'compl. tok':>11}")
+            for locale, calls in sorted(summary['api_calls'].items()):
+                timed_calls = sum(1 for event in self.events if event['type'] == 'api_call'
+                                  and event['locale'] == locale and event['duration_s'] is not None)
+                mean = calls['total_s'] / timed_calls if timed_calls else 0
+                lines.append(f"{locale:<10} {calls['calls']:>6} {calls['errors']:>7} {calls['retries']:>8} {calls['items']:>7} "
+                             f"{mean:>8.2f} {calls['prompt_tokens']:>11} {calls['completion_tokens']:>11}")
+
+        if summary['counters']:
+            lines.append("")
+            lines.extend(f"{name:<32} {value:>10}" for name, value in summary['counters'].items())
+        return "\n".join(lines)
+
+
+# Shared by every tool in the process, so deep call sites (gpt_translate, patch_locales) can record without
+# the recorder being passed down through every signature
+metrics = Metrics()
+
+
+def add_metrics_arguments(parser):
+    """Add the --metrics-file, --no-metrics and --profile options to a tool's argument parser."""
+    parser.add_argument('--metrics-file', help='JSONL file the run\'s metrics are appended to (default: <output-dir>/metrics.jsonl)')
+    parser.add_argument('--no-metrics', action='store_true', help='Do not write metrics or print the metrics summary')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile the run with cProfile, dump the stats to <output-dir>/<tool>.prof and print the hottest functions '
+                             '(work done in --jobs worker processes is not included)')
+
+
+@contextlib.contextmanager
+def instrumented_run(tool, output_dir, args):
+    """Reset the shared metrics for a run of tool and, when it ends, write them and print the summary table.
+
+    args are the parsed options from add_metrics_arguments.
+    """
+    metrics.reset(tool)
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler:
+        profiler.enable()
+    try:
+        with metrics.span('total'):
+            yield metrics
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(output_dir, exist_ok=True)
+            profile_path = os.path.join(output_dir, f"{tool}.prof")
+            profiler.dump_stats(profile_path)
+            print(f"Profile written to {profile_path} (view with: python -m pstats {profile_path})")
+            pstats.Stats(profiler).sort_stats('cumulative').print_stats(PROFILE_TOP_FUNCTIONS)
+        if not args.no_metrics:
+            metrics_path = args.metrics_file or os.path.join(output_dir, 'metrics.jsonl')
+            metrics.write(metrics_path)
+            print(f"\nMetrics for run {metrics.run_id} appended to {metrics_path}\n{metrics.summary_table()}")
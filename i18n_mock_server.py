@@ -0,0 +1,369 @@
+import re
+import json
+import math
+import time
+import uuid
+import random
+import argparse
+import threading
+from collections import deque
+import email.policy
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for the parts of the OpenAI API used by i18n_translator.py, so it can be exercised
+# without spending API credits:
+#   python i18n_translator.py --base-url http://127.0.0.1:8765/v1 ...
+# Chat completions can be slowed down, rate limited and made to fail to exercise concurrency and retries.
+
+LATENCY_DISTRIBUTIONS = ('fixed', 'uniform', 'exponential', 'lognormal')
+TOKEN_WINDOW_SECONDS = 60
+
+
+def estimate_tokens(text):
+    """Roughly estimate the number of tokens in a piece of text (about 4 characters per token)."""
+    return len(str(text)) // 4 + 1
+
+
+def mock_translate(text):
+    """Pseudo-translate a phrase so the output is recognisable."""
+    return f"[mock] {text}"
+
+
+def mock_chat_completion(body, truncate=False):
+    """Build a chat.completion response in the shape gpt_translate expects: {"result": [...]}.
+
+    Multi-locale requests (a {"target_locales", "phrases"} user message) get {"result": {locale: [...]}} instead.
+    With truncate, the JSON content is cut in half and finish_reason is 'length', as when max_tokens is hit.
+    """
+    messages = body.get("messages", [])
+    system_prompt = messages[0]["content"] if messages else ""
+    items = json.loads(messages[-1]["content"]) if messages else []
+
+    if isinstance(items, dict):
+        result = {
+            locale: [{"key": item["key"], "translated_value": mock_translate(item["text"])} for item in items.get("phrases", [])]
+            for locale in items.get("target_locales", {})
+        }
+    else:
+        locale_match = re.search(r'"locale": "([^"<>]+)"', system_prompt)
+        locale = locale_match.group(1) if locale_match else ""
+        result = [
+            {"key": item["key"], "en": item["text"], "translated_value": mock_translate(item["text"]), "locale": locale}
+            for item in items
+        ]
+    content = json.dumps({"result": result}, ensure_ascii=False)
+    if truncate:
+        content = content[:len(content) // 2]
+    prompt_tokens = sum(estimate_tokens(message["content"]) for message in messages)
+    completion_tokens = estimate_tokens(content)
+
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "mock"),
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "length" if truncate else "stop",
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+        },
+    }
+
+
+def error_body(message, error_type, code=None):
+    """Build an OpenAI-style error payload."""
+    return {"error": {"message": message, "type": error_type, "param": None, "code": code}}
+
+
+class MockState:
+    """In-memory files and batches shared by all request handlers, plus the chat completion fault settings."""
+
+    def __init__(self, batch_delay=0.0, latency_ms=0.0, latency_distribution='fixed', latency_spread=0.5,
+                 rate_limit_rate=0.0, server_error_rate=0.0, truncate_rate=0.0, tokens_per_minute=None, seed=None):
+        self.batch_delay = batch_delay
+        self.latency_ms = latency_ms
+        self.latency_distribution = latency_distribution
+        self.latency_spread = latency_spread
+        self.rate_limit_rate = rate_limit_rate
+        self.server_error_rate = server_error_rate
+        self.truncate_rate = truncate_rate
+        self.tokens_per_minute = tokens_per_minute
+        self.random = random.Random(seed)
+        self.token_window = deque()
+        self.stats = {}
+        self.files = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def sample_latency(self):
+        """Draw a response latency in seconds from the configured distribution around latency_ms."""
+        mean = self.latency_ms / 1000
+        if mean <= 0:
+            return 0.0
+        with self.lock:
+            if self.latency_distribution == 'uniform':
+                return self.random.uniform(mean * (1 - self.latency_spread), mean * (1 + self.latency_spread))
+            if self.latency_distribution == 'exponential':
+                return self.random.expovariate(1 / mean)
+            if self.latency_distribution == 'lognormal':
+                # Parameterised so the mean stays at latency_ms; latency_spread is sigma, so the tail grows with it
+                sigma = self.latency_spread
+                return self.random.lognormvariate(math.log(mean) - sigma * sigma / 2, sigma)
+        return mean
+
+    def count(self, outcome):
+        with self.lock:
+            self.stats[outcome] = self.stats.get(outcome, 0) + 1
+
+    def reserve_tokens(self, tokens):
+        """Take tokens from the per-minute budget. Returns 0 if they fit, else the seconds until they would."""
+        if not self.tokens_per_minute:
+            return 0
+        with self.lock:
+            now = time.monotonic()
+            while self.token_window and self.token_window[0][0] <= now - TOKEN_WINDOW_SECONDS:
+                self.token_window.popleft()
+            used = sum(window_tokens for _, window_tokens in self.token_window)
+            if used + tokens > self.tokens_per_minute and self.token_window:
+                # Wait until enough of the oldest requests have left the window
+                freed = 0
+                for timestamp, window_tokens in self.token_window:
+                    freed += window_tokens
+                    if used - freed + tokens <= self.tokens_per_minute:
+                        return max(timestamp + TOKEN_WINDOW_SECONDS - now, 0.01)
+                return TOKEN_WINDOW_SECONDS
+            self.token_window.append((now, tokens))
+            return 0
+
+    def rate_limit_headers(self):
+        """Report the tokens-per-minute budget the way the OpenAI API does, in x-ratelimit-* headers."""
+        if not self.tokens_per_minute:
+            return {}
+        with self.lock:
+            now = time.monotonic()
+            used = sum(window_tokens for timestamp, window_tokens in self.token_window
+                       if timestamp > now - TOKEN_WINDOW_SECONDS)
+            reset = self.token_window[0][0] + TOKEN_WINDOW_SECONDS - now if self.token_window else 0
+        return {"x-ratelimit-limit-tokens": str(self.tokens_per_minute),
+                "x-ratelimit-remaining-tokens": str(max(self.tokens_per_minute - used, 0)),
+                "x-ratelimit-reset-tokens": f"{max(reset, 0):.3f}s"}
+
+    def chat_completion(self, body):
+        """Answer a chat completion request, returning (status code, payload, extra headers)."""
+        time.sleep(self.sample_latency())
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.rate_limit_rate:
+            self.count('429')
+            return 429, error_body("Rate limit reached (injected)", "requests", "rate_limit_exceeded"), {"Retry-After": "1"}
+        roll -= self.rate_limit_rate
+        if roll < self.server_error_rate:
+            self.count('500')
+            return 500, error_body("The server had an error processing your request (injected)", "server_error"), {}
+        roll -= self.server_error_rate
+        truncate = roll < self.truncate_rate
+
+        response = mock_chat_completion(body, truncate=truncate)
+        retry_after = self.reserve_tokens(response["usage"]["total_tokens"])
+        if retry_after:
+            self.count('429_tpm')
+            return 429, error_body(f"Rate limit reached for tokens per minute: limit {self.tokens_per_minute}",
+                                   "tokens", "rate_limit_exceeded"), {"Retry-After": str(math.ceil(retry_after)),
+                                                                      **self.rate_limit_headers()}
+        self.count('truncated' if truncate else '200')
+        return 200, response, self.rate_limit_headers()
+
+    def add_file(self, filename, content, purpose):
+        file_id = f"file-{uuid.uuid4().hex}"
+        with self.lock:
+            self.files[file_id] = {"filename": filename, "content": content, "purpose": purpose,
+                                   "created_at": int(time.time())}
+        return self.file_object(file_id)
+
+    def file_object(self, file_id):
+        file = self.files[file_id]
+        return {"id": file_id, "object": "file", "bytes": len(file["content"]), "created_at": file["created_at"],
+                "filename": file["filename"], "purpose": file["purpose"], "status": "processed"}
+
+    def create_batch(self, input_file_id, endpoint, completion_window):
+        batch_id = f"batch_{uuid.uuid4().hex}"
+        lines = [line for line in self.files[input_file_id]["content"].decode("utf-8").splitlines() if line.strip()]
+        with self.lock:
+            self.batches[batch_id] = {
+                "id": batch_id, "object": "batch", "endpoint": endpoint, "input_file_id": input_file_id,
+                "completion_window": completion_window, "status": "in_progress", "created_at": int(time.time()),
+                "output_file_id": None, "error_file_id": None,
+                "request_counts": {"total": len(lines), "completed": 0, "failed": 0},
+                "_ready_at": time.time() + self.batch_delay,
+            }
+        return self.batch_object(batch_id)
+
+    def batch_object(self, batch_id):
+        batch = self.batches[batch_id]
+        if batch["status"] == "in_progress" and time.time() >= batch["_ready_at"]:
+            self.complete_batch(batch)
+        return {key: value for key, value in batch.items() if not key.startswith("_")}
+
+    def cancel_batch(self, batch_id):
+        with self.lock:
+            batch = self.batches[batch_id]
+            if batch["status"] == "in_progress":
+                batch["status"] = "cancelled"
+        return self.batch_object(batch_id)
+
+    def complete_batch(self, batch):
+        output_lines = []
+        for line in self.files[batch["input_file_id"]]["content"].decode("utf-8").splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            output_lines.append(json.dumps({
+                "id": f"batch_req_{uuid.uuid4().hex}",
+                "custom_id": request["custom_id"],
+                "response": {"status_code": 200, "request_id": uuid.uuid4().hex,
+                             "body": mock_chat_completion(request["body"])},
+                "error": None,
+            }, ensure_ascii=False))
+
+        output = self.add_file("batch_output.jsonl", ("\n".join(output_lines) + "\n").encode("utf-8"), "batch_output")
+        batch["output_file_id"] = output["id"]
+        batch["request_counts"]["completed"] = len(output_lines)
+        batch["status"] = "completed"
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, payload, status=200, headers=None):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        path = self.path.split("?")[0].rstrip("/")
+        match = re.fullmatch(r"/v1/files/([\w-]+)/content", path)
+        if match and match.group(1) in self.state.files:
+            data = self.state.files[match.group(1)]["content"]
+            self.send_response(200)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        match = re.fullmatch(r"/v1/batches/([\w-]+)", path)
+        if match and match.group(1) in self.state.batches:
+            self.send_json(self.state.batch_object(match.group(1)))
+            return
+        if path == "/v1/mock/stats":
+            with self.state.lock:
+                self.send_json(dict(self.state.stats))
+            return
+        self.send_json({"error": {"message": f"Unknown path {path}", "type": "invalid_request_error"}}, 404)
+
+    def do_POST(self):
+        path = self.path.split("?")[0].rstrip("/")
+        body = self.read_body()
+
+        if path == "/v1/chat/completions":
+            status, payload, headers = self.state.chat_completion(json.loads(body))
+            self.send_json(payload, status, headers)
+        elif path == "/v1/files":
+            # Parse the multipart upload with the email parser (the cgi module is gone in Python 3.13)
+            header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8")
+            message = BytesParser(policy=email.policy.HTTP).parsebytes(header + body)
+            fields = {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+            upload = fields["file"]
+            self.send_json(self.state.add_file(upload.get_filename(), upload.get_payload(decode=True),
+                                               fields["purpose"].get_content().strip()))
+        elif path == "/v1/batches":
+            request = json.loads(body)
+            if request.get("input_file_id") not in self.state.files:
+                self.send_json({"error": {"message": "Unknown input file", "type": "invalid_request_error"}}, 400)
+                return
+            self.send_json(self.state.create_batch(request["input_file_id"], request["endpoint"],
+                                                   request["completion_window"]))
+        elif (match := re.fullmatch(r"/v1/batches/([\w-]+)/cancel", path)) and match.group(1) in self.state.batches:
+            self.send_json(self.state.cancel_batch(match.group(1)))
+        else:
+            self.send_json({"error": {"message": f"Unknown path {path}", "type": "invalid_request_error"}}, 404)
+
+
+def start_server(host, port, state):
+    """Start the mock server on a background thread and return it; port 0 picks a free port."""
+    handler = type("BoundMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def serve(host, port, state):
+    """Run the mock server until interrupted."""
+    server = start_server(host, port, state)
+    print(f"Mock OpenAI server listening on http://{host}:{server.server_port}/v1")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def add_server_arguments(parser):
+    """Add the options that shape the mock server's behaviour (shared with i18n_loadtest.py)."""
+    parser.add_argument('--batch-delay', type=float, default=0.0,
+                        help='Seconds before a submitted batch is reported as completed (default: 0)')
+    parser.add_argument('--latency-ms', type=float, default=0.0,
+                        help='Mean chat completion latency in milliseconds (default: 0)')
+    parser.add_argument('--latency-distribution', choices=LATENCY_DISTRIBUTIONS, default='fixed',
+                        help='Shape of the latency distribution (default: fixed)')
+    parser.add_argument('--latency-spread', type=float, default=0.5,
+                        help='Relative half-width for uniform, sigma for lognormal latencies (default: 0.5)')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0,
+                        help='Fraction of chat completions answered with 429 (default: 0)')
+    parser.add_argument('--server-error-rate', type=float, default=0.0,
+                        help='Fraction of chat completions answered with 500 (default: 0)')
+    parser.add_argument('--truncate-rate', type=float, default=0.0,
+                        help="Fraction of chat completions whose JSON is cut off with finish_reason 'length' (default: 0)")
+    parser.add_argument('--tpm', type=int, default=None,
+                        help='Tokens-per-minute limit; requests beyond it get 429 with Retry-After (default: unlimited)')
+    parser.add_argument('--seed', type=int, default=None, help='Random seed for latencies and injected faults')
+
+
+def state_from_args(args):
+    """Build a MockState from the parsed add_server_arguments options."""
+    return MockState(args.batch_delay, args.latency_ms, args.latency_distribution, args.latency_spread,
+                     args.rate_limit_rate, args.server_error_rate, args.truncate_rate, args.tpm, args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local stand-in for the OpenAI endpoints used by i18n_translator.py.')
+    parser.add_argument('--host', default='127.0.0.1', help='Host to bind (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765, help='Port to bind (default: 8765)')
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    serve(args.host, args.port, state_from_args(args))
+
+
+if __name__ == "__main__":
+    main()
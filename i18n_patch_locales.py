@@ -1,10 +1,15 @@
 import os
+import copy
 import shutil
 import pandas as pd
 import json
 import re
 import math
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from i18n_locale_tree import LocaleTreeLoader, flatten_keys
+from i18n_metrics import add_metrics_arguments, instrumented_run, metrics
+from i18n_source_hashes import SIDECAR_NAME, record_source_hashes, sidecar_path
 
 def parse_arguments():
     """Parse command line arguments."""
@@ -17,6 +22,16 @@ def parse_arguments():
                        help='Path to the CSV file with translations (default: locale_comparison/translated_locale_key_comparison_consolidated.csv)')
     parser.add_argument('--output-dir', default='locale_comparison',
                        help='Output directory for comparison files (default: locale_comparison)')
+    parser.add_argument('--jobs', type=int, default=None,
+                       help='Number of locales to patch in parallel (default: number of CPUs)')
+    parser.add_argument('--prune-extraneous', action='store_true',
+                       help='Remove keys that exist in a locale but not in English')
+    parser.add_argument('--source-hashes',
+                       help='English source hash sidecar to record applied translations in, read by i18n_checker.py compare '
+                            '(default: <source-locale-path>/.i18n_source_hashes.json)')
+    parser.add_argument('--dry-run', action='store_true',
+                       help='Print the per-file key changes against the target directory without copying or writing anything')
+    add_metrics_arguments(parser)
     return parser.parse_args()
 
 def load_csv(file_path):
@@ -31,9 +46,11 @@ def load_json(file_path):
     return {}
 
 def save_json(file_path, data):
-    """Save a dictionary as a JSON file."""
-    with open(file_path, 'w', encoding='utf-8') as f:
+    """Atomically save a dictionary as a JSON file (write a temp file, then rename it over the target)."""
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(temp_path, file_path)
 
 def create_directory_if_missing(directory_path):
     """Create a directory if it does not exist."""
@@ -41,22 +58,18 @@ def create_directory_if_missing(directory_path):
         os.makedirs(directory_path)
 
 def copy_source_locales(source_locale_dir_path, locale_dir_path):
-    """Copy all locale files from the source repository to the target locale directory."""
+    """Copy all locale files from the source repository to the target locale directory.
+
+    The source hash sidecar stays behind: it is updated in place in the source directory, and a stale copy in the
+    target would overwrite it when the patched locales are copied back.
+    """
     if os.path.exists(source_locale_dir_path):
-        shutil.copytree(source_locale_dir_path, locale_dir_path, dirs_exist_ok=True)
+        shutil.copytree(source_locale_dir_path, locale_dir_path, dirs_exist_ok=True,
+                        ignore=shutil.ignore_patterns(SIDECAR_NAME))
         print(f"Copied source locales from {source_locale_dir_path} to {locale_dir_path}")
     else:
         print(f"Source locale directory {source_locale_dir_path} does not exist.")
 
-def find_json_files(base_directory):
-    """Recursively find all JSON files in the specified directory."""
-    json_files = []
-    for root, _, files in os.walk(base_directory):
-        for file in files:
-            if file.endswith(".json"):
-                json_files.append(os.path.join(root, file))
-    return json_files
-
 def update_nested_dict(d, keys, value):
     """Update a nested dictionary given a list of keys."""
     for key in keys[:-1]:
@@ -81,44 +94,180 @@ def handle_invalid_value(value):
         return None
     return value
 
-def update_locale_json(locale, json_file, label_key, translated_value, locale_dir_path):
-    """Update a JSON file with the new translation."""
-    locale_folder_path = os.path.join(locale_dir_path, locale)
-    locale_json_path = os.path.join(locale_folder_path, json_file)
+def group_patches(df):
+    """Group the non-empty translations in the CSV by locale and JSON file, keeping CSV order.
+
+    CSV cells are strings, so each value is converted back to its JSON type here.
+    """
+    patches = {}
+    for locale, json_file, label_key, translated_value in df[['locale', 'json_file', 'label_key', 'translated_value']].itertuples(index=False):
+        if pd.notna(translated_value) and translated_value.strip() != "":
+            translated_value = handle_invalid_value(convert_to_valid_json(translated_value))
+            patches.setdefault(locale, {}).setdefault(json_file, []).append((label_key, translated_value))
+    return patches
+
+def source_records(df, all_en_keys):
+    """Return (locale, label_key, English source) for every applied translation, for the source hash sidecar.
+
+    The source is the original_en_value the translator recorded, falling back to the current English value.
+    CSV cells are strings, so when the recorded value is the current English value written out as text, the
+    typed English value is recorded instead; its hash then matches the one 'compare' computes from the JSON.
+    """
+    en_values = {}
+    for en_leaves in all_en_keys.values():
+        en_values.update(en_leaves)
+    has_original = 'original_en_value' in df.columns
+    records = []
+    for row in df.itertuples(index=False):
+        if pd.isna(row.translated_value) or str(row.translated_value).strip() == "":
+            continue
+        en_value = en_values.get(row.label_key)
+        source = row.original_en_value if has_original and pd.notna(row.original_en_value) else en_value
+        if source is not None and not isinstance(en_value, str) and (
+                source == en_value or (isinstance(source, str) and convert_to_valid_json(source) == en_value)):
+            source = en_value
+        if source is not None:
+            records.append((row.locale, row.label_key, source))
+    return records
+
+def delete_nested_key(d, keys):
+    """Delete a leaf from a nested dictionary given a list of keys, dropping parents left empty."""
+    parents = []
+    for key in keys[:-1]:
+        if not isinstance(d.get(key), dict):
+            return
+        parents.append((d, key))
+        d = d[key]
+    d.pop(keys[-1], None)
+    for parent, key in reversed(parents):
+        if parent[key]:
+            break
+        del parent[key]
+
+def forget_overwritten_leaves(leaves, label_key):
+    """Drop the leaves that writing a new label_key replaces: a leaf on its path or one nested below it."""
+    parts = label_key.split('.')
+    for i in range(1, len(parts)):
+        leaves.pop('.'.join(parts[:i]), None)
+    prefix = label_key + '.'
+    for nested_key in [key for key in leaves if key.startswith(prefix)]:
+        del leaves[nested_key]
+
+def merge_locale_file(json_data, en_leaves, patches, prune_extraneous=False):
+    """Merge English leaf keys and translations into a locale file's data in place.
+
+    patches is a list of (label_key, value) with values already in their JSON types.
+
+    Returns (added, removed, updated): the leaf paths added from English, removed as extraneous and
+    changed by a translation, each as a list of (label_key, old value, new value).
+    """
+    added, removed, updated = [], [], []
 
-    create_directory_if_missing(locale_folder_path)
-    json_data = load_json(locale_json_path)
+    if en_leaves is not None:
+        locale_leaves = flatten_keys(json_data)
 
-    keys = label_key.split('.')
-    translated_value = convert_to_valid_json(translated_value)
-    translated_value = handle_invalid_value(translated_value)
+        for label_key, en_value in en_leaves.items():
+            if label_key not in locale_leaves:
+                update_nested_dict(json_data, label_key.split('.'), en_value)
+                added.append((label_key, None, en_value))
+
+        if prune_extraneous:
+            for label_key, value in locale_leaves.items():
+                if label_key not in en_leaves:
+                    delete_nested_key(json_data, label_key.split('.'))
+                    removed.append((label_key, value, None))
+
+    if patches:
+        # Flattened once per file and kept in step with json_data as each patch lands
+        leaves = flatten_keys(json_data)
+    for label_key, translated_value in patches:
+        old_value = leaves.get(label_key)
+        if old_value != translated_value or label_key not in leaves:
+            if label_key not in leaves:
+                forget_overwritten_leaves(leaves, label_key)
+            update_nested_dict(json_data, label_key.split('.'), translated_value)
+            leaves[label_key] = translated_value
+            updated.append((label_key, old_value, translated_value))
+
+    return added, removed, updated
 
-    update_nested_dict(json_data, keys, translated_value)
-    save_json(locale_json_path, json_data)
+def patch_locale(locale, all_en_keys, file_patches, locale_dir_path, prune_extraneous=False, dry_run=False):
+    """Bring every JSON file of a locale in line with English and apply its translations.
 
-def ensure_all_keys_present(locale, all_en_keys, locale_dir_path):
-    """Ensure that all English keys are present in the locale JSON files."""
+    Each file is loaded once and only written if its content actually changed. all_en_keys is None for
+    locales that only receive translations. Returns (changed files, files read), where each changed file is
+    (json_file, added, removed, updated) and files read counts the locale files that existed and were loaded.
+    """
     locale_folder_path = os.path.join(locale_dir_path, locale)
-    create_directory_if_missing(locale_folder_path)
+    if not dry_run:
+        create_directory_if_missing(locale_folder_path)
+    json_files = list(all_en_keys or {}) + [json_file for json_file in file_patches if json_file not in (all_en_keys or {})]
+    changed_files = []
+    files_read = 0
 
-    for json_file, keys in all_en_keys.items():
+    for json_file in json_files:
         locale_json_path = os.path.join(locale_folder_path, json_file)
+        exists = os.path.exists(locale_json_path)
         json_data = load_json(locale_json_path)
+        files_read += exists
+        original_data = copy.deepcopy(json_data)
+        en_leaves = all_en_keys.get(json_file) if all_en_keys is not None else None
 
-        for label_key, en_value in keys.items():
-            if label_key not in json_data:
-                update_nested_dict(json_data, label_key.split('.'), en_value)
-        save_json(locale_json_path, json_data)
+        added, removed, updated = merge_locale_file(json_data, en_leaves, file_patches.get(json_file, []), prune_extraneous)
+
+        if json_data != original_data or not exists:
+            if not dry_run:
+                save_json(locale_json_path, json_data)
+            changed_files.append((json_file, added, removed, updated))
+
+    return changed_files, files_read
 
-def load_all_en_keys(en_locale_dir_path):
-    """Load all English keys to ensure consistency across locales."""
-    all_en_keys = {}
+def print_locale_diff(locale, changed_files, dry_run=False):
+    """Print the key changes made (or, in a dry run, that would be made) to a locale's files."""
+    for json_file, added, removed, updated in changed_files:
+        print(f"{'Would update' if dry_run else 'Updated'} {locale}/{json_file}: "
+              f"{len(added)} added, {len(removed)} removed, {len(updated)} translated")
+        if dry_run:
+            for label_key, _, new_value in added:
+                print(f"  + {label_key}: {new_value!r}")
+            for label_key, old_value, _ in removed:
+                print(f"  - {label_key}: {old_value!r}")
+            for label_key, old_value, new_value in updated:
+                print(f"  ~ {label_key}: {old_value!r} -> {new_value!r}")
 
-    for json_file in find_json_files(en_locale_dir_path):
-        file_basename = os.path.basename(json_file)
-        en_data = load_json(json_file)
-        all_en_keys[file_basename] = en_data
+def patch_locales(locales, all_en_keys, patches, locale_dir_path, jobs=None, prune_extraneous=False, dry_run=False):
+    """Patch every locale, in parallel across a process pool unless jobs is 1."""
+    arguments = [(locale, all_en_keys if locale in locales else None, patches.get(locale, {}), locale_dir_path,
+                  prune_extraneous, dry_run)
+                 for locale in locales + [locale for locale in patches if locale not in locales]]
 
+    # Every locale checks each English leaf and each of its patches
+    keys = sum(sum(len(leaves) for leaves in (en_keys or {}).values()) + sum(len(p) for p in file_patches.values())
+               for _, en_keys, file_patches, *_ in arguments)
+
+    with metrics.span('patch_locales', keys=keys, locales=len(arguments)) as span:
+        if jobs == 1 or len(arguments) <= 1:
+            results = [patch_locale(*locale_arguments) for locale_arguments in arguments]
+        else:
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(patch_locale, *zip(*arguments)))
+        span['files_read'] = sum(files_read for _, files_read in results)
+        span['files_written'] = 0 if dry_run else sum(len(changed_files) for changed_files, _ in results)
+
+    metrics.count('files_read', span['files_read'])
+    metrics.count('files_written', span['files_written'])
+
+    total_files = 0
+    for locale_arguments, (changed_files, _) in zip(arguments, results):
+        print_locale_diff(locale_arguments[0], changed_files, dry_run)
+        total_files += len(changed_files)
+    print(f"{total_files} files {'would change' if dry_run else 'changed'} across {len(arguments)} locales")
+
+def load_all_en_keys(en_locale_dir_path, loader=None):
+    """Load all English leaf keys, per JSON file, to ensure consistency across locales."""
+    loader = loader or LocaleTreeLoader()
+    all_en_keys = loader.load_locale(en_locale_dir_path)
+    loader.save()
     return all_en_keys
 
 def main():
@@ -131,30 +280,32 @@ def main():
     csv_file_path = args.csv_file
     en_locale_dir_path = os.path.join(locale_dir_path, 'en')
     
-    # Step 1: Copy the source locales to the target directory
-    copy_source_locales(source_locale_dir_path, locale_dir_path)
-
-    # Step 2: Load all English keys to use as a reference
-    all_en_keys = load_all_en_keys(en_locale_dir_path)
+    with instrumented_run('i18n_patch_locales', args.output_dir, args):
+        # Step 1: Copy the source locales to the target directory (a dry run inspects the target as it is)
+        if not args.dry_run:
+            with metrics.span('copy_source_locales'):
+                copy_source_locales(source_locale_dir_path, locale_dir_path)
 
-    # Step 3: Ensure all locales have the necessary keys from English as a baseline
-    for locale in os.listdir(locale_dir_path):
-        if os.path.isdir(os.path.join(locale_dir_path, locale)) and locale != 'en':
-            ensure_all_keys_present(locale, all_en_keys, locale_dir_path)
+        # Step 2: Load all English keys to use as a reference
+        with metrics.span('load_english'):
+            all_en_keys = load_all_en_keys(en_locale_dir_path)
 
-    # Step 4: Load the translation CSV
-    df = load_csv(csv_file_path)
+        # Step 3: Load the translation CSV
+        with metrics.span('load_csv') as span:
+            df = load_csv(csv_file_path)
+            patches = group_patches(df)
+            span['keys'] = len(df)
 
-    # Step 5: Patch the locale files with the translated values
-    for _, row in df.iterrows():
-        locale = row['locale']
-        json_file = row['json_file']
-        label_key = row['label_key']
-        translated_value = row['translated_value']
+        # Step 4: Ensure all locales have the English keys as a baseline and patch in the translated values,
+        # writing only the files whose content changes
+        locales = sorted(locale for locale in os.listdir(locale_dir_path)
+                         if os.path.isdir(os.path.join(locale_dir_path, locale)) and locale != 'en')
+        patch_locales(locales, all_en_keys, patches, locale_dir_path, args.jobs, args.prune_extraneous, args.dry_run)
 
-        if pd.notna(translated_value) and translated_value.strip() != "":
-            print(f"Updating {locale}/{json_file}: {label_key} -> {translated_value}")
-            update_locale_json(locale, json_file, label_key, translated_value, locale_dir_path)
+        # Step 5: Record the English text each translation was made from, so later English edits show up as stale.
+        # The sidecar is written where 'compare' reads it, next to the source locales
+        if not args.dry_run:
+            record_source_hashes(args.source_hashes or sidecar_path(source_locale_dir_path), source_records(df, all_en_keys))
 
 if __name__ == "__main__":
     main()
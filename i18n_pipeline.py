@@ -0,0 +1,325 @@
+import os
+import time
+import argparse
+import pandas as pd
+from i18n_checker import compare_keys_in_locales
+from i18n_journal import JOURNAL_NAME, TranslationJournal
+from i18n_locale_tree import LocaleTreeLoader, find_json_files
+from i18n_metrics import add_metrics_arguments, instrumented_run, metrics
+from i18n_patch_locales import copy_source_locales, patch_locales
+from i18n_qa import namespace_columns, write_translation_comparison
+from i18n_qa_issues import find_issues, load_glossary, summarize_issues, write_issue_report
+from i18n_source_hashes import record_source_hashes, sidecar_path
+from i18n_translation_memory import TranslationMemory
+from i18n_translator import (add_translation_arguments, configure_api_endpoint, process_missing_translations,
+                             rate_controller_from_args, save_updated_df, update_translations_in_dataframe)
+
+
+# Longest wait between watch mode retries of keys that failed to translate, in seconds
+MAX_RETRY_DELAY = 300
+
+
+def comparison_frames(all_en_data, results):
+    """Build the translator's two input tables from the compare results, keeping every English value's JSON type.
+
+    The rows are the same as in english_labels.csv and locale_key_comparison_consolidated.csv, in the same order.
+    """
+    english_labels_df = pd.DataFrame(
+        [(key, entry.value, entry.json_file) for key, entry in all_en_data.items()],
+        columns=['label_key', 'value', 'json_file']
+    )
+    comparison_rows = []
+    for locale, result in results.items():
+        comparison_rows.extend((locale, 'missing', key, json_file) for key, json_file in result['missing_keys'])
+        comparison_rows.extend((locale, 'stale', key, json_file) for key, json_file in result['stale_keys'])
+        comparison_rows.extend((locale, 'extraneous', key, json_file) for key, json_file in result['extraneous_keys'])
+    locale_key_comparison_df = pd.DataFrame(comparison_rows, columns=['locale', 'status', 'label_key', 'json_file'])
+    return english_labels_df, locale_key_comparison_df
+
+
+def translation_patches(translations, all_en_data):
+    """Group translations into the patcher's {locale: {json_file: [(label_key, value)]}}, skipping empty values."""
+    patches = {}
+    for translation in translations:
+        translated_value = translation['translated_value']
+        if translated_value is None or (isinstance(translated_value, str) and translated_value.strip() == ""):
+            continue
+        json_file = all_en_data[translation['key']].json_file
+        patches.setdefault(translation['locale'], {}).setdefault(json_file, []).append((translation['key'], translated_value))
+    return patches
+
+
+def applied_sources(translations):
+    """Return (locale, label_key, English source) for the source hash sidecar, skipping empty translations."""
+    return [(translation['locale'], translation['key'], translation['en']) for translation in translations
+            if translation['translated_value'] is not None and str(translation['translated_value']).strip() != ""]
+
+
+def build_qa_matrix(en_data, all_locale_data):
+    """Build the QA matrix (json_file, key, english, one column per locale) as a DataFrame of strings."""
+    locales = sorted(all_locale_data)
+    header = ["json_file", "key", "english"] + locales
+    columns = [[] for _ in header]
+    for json_file, en_keys in en_data.items():
+        locale_files = [all_locale_data[locale].get(json_file, {}) for locale in locales]
+        for column, values in zip(columns, namespace_columns(json_file, en_keys, locale_files)):
+            column.extend(values)
+    matrix = pd.DataFrame(dict(zip(header, columns)), columns=header)
+    return matrix.map(lambda value: '' if value is None else str(value))
+
+
+def open_journal(args):
+    """Open the translation journal in the output directory, once per pipeline invocation; --resume reuses it."""
+    return TranslationJournal(os.path.join(args.output_dir, JOURNAL_NAME), args.resume)
+
+
+def translate_missing(args, english_labels_df, locale_key_comparison_df, journal=None):
+    """Translate the missing rows with the translator options in args, through the translation memory unless disabled.
+
+    Completed requests are recorded in journal, if given.
+    """
+    translation_memory = None
+    if not args.no_translation_memory:
+        translation_memory = TranslationMemory(args.translation_memory, args.tm_ttl_days, args.tm_max_entries)
+    translations = process_missing_translations(english_labels_df, locale_key_comparison_df, args.concurrency,
+                                                args.max_input_tokens, args.max_output_tokens, translation_memory,
+                                                args.output_dir if args.batch else None, args.batch_poll_interval,
+                                                args.output_dir, rate_controller_from_args(args),
+                                                not args.no_dedupe, args.dedupe_exclude, args.locales_per_request,
+                                                journal)
+    if translation_memory is not None:
+        print(translation_memory.summary())
+        translation_memory.close()
+    return translations
+
+
+def run_pipeline(args):
+    """Compare, translate, patch and QA in one process, handing records between stages in memory.
+
+    CSV files are only written as artifacts when args.write_csv is set; the patched JSON files and the
+    intermediate translations are always written.
+    """
+    os.makedirs(args.output_dir, exist_ok=True)
+    en_locale_path = args.en_locale_path or os.path.join(args.base_path, 'en')
+    loader = LocaleTreeLoader()
+
+    # Step 1: Find missing and extraneous keys in every locale
+    print("== compare ==")
+    with metrics.span('stage_compare') as span:
+        all_en_data, results = compare_keys_in_locales(args.base_path, en_locale_path, args.output_dir, use_manifest=False,
+                                                       loader=loader, jobs=args.jobs, write_csv=args.write_csv,
+                                                       source_hashes_path=args.source_hashes)
+        english_labels_df, locale_key_comparison_df = comparison_frames(all_en_data, results)
+        span['keys'] = len(all_en_data) * len(results)
+
+    # Step 2: Translate the missing keys
+    print("== translate ==")
+    with metrics.span('stage_translate') as span:
+        journal = open_journal(args)
+        try:
+            translations = translate_missing(args, english_labels_df, locale_key_comparison_df, journal)
+        finally:
+            journal.close()
+        span['keys'] = len(translations)
+        if args.write_csv:
+            translated_df = update_translations_in_dataframe(translations, locale_key_comparison_df.copy())
+            save_updated_df(translated_df, os.path.join(args.output_dir, 'translated_locale_key_comparison_consolidated.csv'))
+
+    # Step 3: Copy the locales to the target directory and patch in the translations
+    print("== patch ==")
+    with metrics.span('stage_patch'):
+        if os.path.abspath(args.target_locale_path) != os.path.abspath(args.base_path):
+            copy_source_locales(args.base_path, args.target_locale_path)
+        target_en_path = os.path.join(args.target_locale_path, 'en')
+        patches = translation_patches(translations, all_en_data)
+        locales = loader.list_locales(args.target_locale_path)
+        patch_locales(locales, loader.load_locale(target_en_path), patches, args.target_locale_path, args.jobs,
+                      args.prune_extraneous)
+        # Recorded next to the source locales, where the next 'compare' reads it
+        record_source_hashes(args.source_hashes or sidecar_path(args.base_path), applied_sources(translations))
+
+    # Step 4: Check the patched locales
+    print("== qa ==")
+    with metrics.span('stage_qa') as span:
+        en_data = loader.load_locale(target_en_path)
+        all_locale_data = loader.load_tree(args.target_locale_path)
+        loader.save()
+        matrix = build_qa_matrix(en_data, all_locale_data)
+        glossary = load_glossary(args.glossary) if args.glossary else None
+        report = find_issues(matrix, glossary)
+        summary = summarize_issues(report, matrix)
+        span['keys'] = len(matrix) * summary['locales']
+        if args.write_csv:
+            output_file = os.path.join(args.output_dir, 'locale_translation_comparison.csv')
+            write_translation_comparison(en_data, all_locale_data, output_file)
+            issues_path, _ = write_issue_report(report, summary, args.output_dir)
+            print(f"Translation comparison written to {output_file}, issues to {issues_path}")
+
+    counts = ', '.join(f"{count} {check}" for check, count in summary['by_check'].items())
+    print(f"Pipeline finished: {len(translations)} translations applied, "
+          f"{summary['issues']} QA issues across {summary['locales']} locales ({counts})")
+    return summary
+
+
+def english_file_state(en_locale_path):
+    """Return {file path: (mtime_ns, size)} for the English JSON files, to detect saves cheaply."""
+    state = {}
+    for file_path in find_json_files(en_locale_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            continue  # Deleted between listing and stat
+        state[file_path] = (stat.st_mtime_ns, stat.st_size)
+    return state
+
+
+def english_key_delta(previous, current):
+    """Return (changed, removed): keys that are new or whose value or file changed, in English order, and keys that are gone."""
+    changed = [key for key, entry in current.items() if previous.get(key) != entry]
+    removed = [key for key in previous if key not in current]
+    return changed, removed
+
+
+def translate_and_patch_keys(args, loader, all_en_data, changed_keys, journal=None):
+    """Translate the given English keys into every locale and patch them in place under args.base_path.
+
+    Returns (translations, translated keys), where a key counts as translated once every locale received
+    a non-empty translation for it.
+    """
+    locales = loader.list_locales(args.base_path)
+    english_labels_df = pd.DataFrame(
+        [(key, all_en_data[key].value, all_en_data[key].json_file) for key in changed_keys],
+        columns=['label_key', 'value', 'json_file']
+    )
+    locale_key_comparison_df = pd.DataFrame(
+        [(locale, 'missing', key, all_en_data[key].json_file) for locale in locales for key in changed_keys],
+        columns=['locale', 'status', 'label_key', 'json_file']
+    )
+    translations = translate_missing(args, english_labels_df, locale_key_comparison_df, journal) if changed_keys else []
+
+    en_locale_path = args.en_locale_path or os.path.join(args.base_path, 'en')
+    patch_locales(locales, loader.load_locale(en_locale_path), translation_patches(translations, all_en_data),
+                  args.base_path, args.jobs, args.prune_extraneous)
+    applied = applied_sources(translations)
+    record_source_hashes(args.source_hashes or sidecar_path(args.base_path), applied)
+    applied_pairs = {(locale, key) for locale, key, _ in applied}
+    translated_keys = [key for key in changed_keys if all((locale, key) in applied_pairs for locale in locales)]
+    return translations, translated_keys
+
+
+def watch_pipeline(args):
+    """Poll the English locale directory and, once a burst of saves settles, translate and patch only the changed keys.
+
+    Locales are patched in place under args.base_path. Keys that already exist when watching starts are
+    left alone; run the pipeline once first to fill in anything that is already missing. Keys that fail
+    to translate, or a cycle that raises, are retried after a backoff that doubles up to MAX_RETRY_DELAY.
+    """
+    os.makedirs(args.output_dir, exist_ok=True)
+    en_locale_path = args.en_locale_path or os.path.join(args.base_path, 'en')
+    loader = LocaleTreeLoader()
+    all_en_data = loader.load_locale_keys(en_locale_path)
+    loader.save()
+    seen_state = english_file_state(en_locale_path)
+    last_change = None
+    retry_at = None
+    retry_delay = args.debounce
+    # One journal for the whole session, rather than one truncated (or, with --resume, reread) per cycle
+    journal = open_journal(args)
+    print(f"Watching {en_locale_path} ({len(all_en_data)} keys), polling every {args.poll_interval}s. Press Ctrl+C to stop.")
+
+    try:
+        while True:
+            time.sleep(args.poll_interval)
+            state = english_file_state(en_locale_path)
+            if state != seen_state:
+                # Restart the debounce window on every save so a burst of edits is handled once
+                seen_state = state
+                last_change = time.monotonic()
+                continue
+            settled = last_change is not None and time.monotonic() - last_change >= args.debounce
+            if not settled and (retry_at is None or time.monotonic() < retry_at):
+                continue
+            last_change = None
+            retry_at = None
+
+            try:
+                current_en_data = loader.load_locale_keys(en_locale_path)
+            except ValueError as e:
+                print(f"Warning: Could not parse the English locale files, waiting for the next save: {e}")
+                continue
+
+            changed_keys, removed_keys = english_key_delta(all_en_data, current_en_data)
+            if not changed_keys and not removed_keys:
+                continue
+
+            started = time.monotonic()
+            print(f"English changed: {len(changed_keys)} keys added or edited, {len(removed_keys)} removed")
+            try:
+                with metrics.span('watch_cycle', keys=len(changed_keys)):
+                    translations, translated_keys = translate_and_patch_keys(args, loader, current_en_data, changed_keys,
+                                                                             journal)
+                    loader.save()
+            except Exception as e:
+                translated_keys = []
+                print(f"Error: Watch cycle failed, will retry: {e}")
+            else:
+                print(f"Applied {len(translations)} translations in {time.monotonic() - started:.1f}s")
+                for key in removed_keys:
+                    all_en_data.pop(key, None)
+
+            # Only translated keys move into the baseline, so the rest show up in the next delta again
+            for key in translated_keys:
+                all_en_data[key] = current_en_data[key]
+            pending = len(changed_keys) - len(translated_keys)
+            if pending:
+                retry_at = time.monotonic() + retry_delay
+                print(f"{pending} keys not translated into every locale, retrying in {retry_delay:.0f}s")
+                retry_delay = min(retry_delay * 2, MAX_RETRY_DELAY)
+            else:
+                retry_delay = args.debounce
+    except KeyboardInterrupt:
+        print("Stopped watching.")
+    finally:
+        journal.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the compare -> translate -> patch -> qa workflow in one process.')
+    parser.add_argument('mode', choices=['run', 'watch'],
+                        help="Mode of operation: 'run' the whole pipeline once, or 'watch' English and translate changed keys as they are saved.")
+    parser.add_argument('--base-path', required=True, help='Base path of the source locales (e.g. /path/to/project/public/locales)')
+    parser.add_argument('--en-locale-path', help='Path to the English locale directory (default: <base-path>/en)')
+    parser.add_argument('--target-locale-path', default='locales',
+                        help="Directory where the patched locales are written; may equal --base-path to patch in place "
+                             "(default: locales; 'watch' mode always patches --base-path in place)")
+    parser.add_argument('--output-dir', default='locale_comparison',
+                        help='Directory for intermediate translations and CSV artifacts (default: locale_comparison)')
+    parser.add_argument('--write-csv', action='store_true',
+                        help='Also write the CSV files the individual scripts produce, as artifacts for review')
+    parser.add_argument('--jobs', type=int, default=1, help='Number of processes used to compare and patch locales (default: 1)')
+    parser.add_argument('--prune-extraneous', action='store_true', help='Remove keys that exist in a locale but not in English')
+    parser.add_argument('--poll-interval', type=float, default=1.0,
+                        help="Seconds between checks of the English locale files ('watch' mode, default: 1)")
+    parser.add_argument('--debounce', type=float, default=2.0,
+                        help="Seconds without further saves before changes are processed ('watch' mode, default: 2)")
+    parser.add_argument('--glossary', help='Glossary CSV for the QA checks (see i18n_qa_issues.py)')
+    parser.add_argument('--source-hashes',
+                        help='English source hash sidecar for stale detection (default: <base-path>/.i18n_source_hashes.json)')
+    add_translation_arguments(parser)
+    add_metrics_arguments(parser)
+    args = parser.parse_args()
+    configure_api_endpoint(args.base_url)
+
+    with instrumented_run(f"i18n_pipeline_{args.mode}", args.output_dir, args):
+        if args.mode == 'run':
+            run_pipeline(args)
+        elif args.mode == 'watch':
+            watch_pipeline(args)
+
+
+if __name__ == "__main__":
+    main()
+
+# Example usage:
+# python i18n_pipeline.py run --base-path /path/to/project/public/locales --target-locale-path locales --output-dir locale_comparison --concurrency 4
+# python i18n_pipeline.py watch --base-path /path/to/project/public/locales --output-dir locale_comparison
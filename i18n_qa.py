@@ -1,101 +1,172 @@
 import os
-import json
 import csv
 import argparse
-
-# Function to recursively find JSON files
-def find_json_files(base_directory):
-    json_files = []
-    for root, _, files in os.walk(base_directory):
-        for file in files:
-            if file.endswith(".json"):
-                json_files.append(os.path.join(root, file))
-    return json_files
-
-# Function to recursively extract keys and their values, including subkeys
-def extract_keys(data, json_file, parent_key=''):
+from i18n_locale_tree import LocaleTreeLoader, find_json_files, flatten_keys, parse_json
+from i18n_metrics import add_metrics_arguments, instrumented_run, metrics
+
+try:
+    import pyarrow  # Optional, needed for Parquet/Arrow output
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+OUTPUT_FORMATS = ('csv', 'parquet', 'arrow')
+
+# Function to load one locale directory as {json_file: {key: value}}; key strings are interned and the
+# per-file dicts come straight from the shared loader, so nothing is duplicated per locale
+def load_locale_data(locale_path, loader):
+    return loader.load_locale(locale_path)
+
+# Function to index a locale directory as {json_file: [file paths]} without parsing anything
+def index_namespaces(locale_path):
+    namespaces = {}
+    for file_path in find_json_files(locale_path):
+        namespaces.setdefault(os.path.basename(file_path), []).append(file_path)
+    return namespaces
+
+# Function to parse one namespace of one locale; files sharing a name are merged, as load_locale does
+def load_namespace(file_paths):
     keys = {}
-    for key, value in data.items():
-        full_key = f"{parent_key}.{key}" if parent_key else key
-        if isinstance(value, dict):
-            # Recursively extract subkeys
-            keys.update(extract_keys(value, json_file, full_key))
-        else:
-            # Store the key-value pair
-            keys[(full_key, json_file)] = value
+    for file_path in file_paths:
+        with open(file_path, 'rb') as f:
+            keys.update(flatten_keys(parse_json(f.read())))
     return keys
 
-# Function to load English keys and values from the English JSON files
-def load_english_data(en_json_files):
-    en_data = {}
-    for en_file in en_json_files:
-        json_data, json_file = load_json(en_file)
-        en_data.update(extract_keys(json_data, json_file))  # Extract subkeys as well
-    return en_data
-
-# Function to load translations for all locales
-def load_locale_data(locale_files):
-    locale_data = {}
-    for locale_file in locale_files:
-        json_data, json_file = load_json(locale_file)
-        locale_data.update(extract_keys(json_data, json_file))  # Extract subkeys as well
-    return locale_data
-
-# Function to load a JSON file and return its content along with the file name
-def load_json(file_path):
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return json.load(f), os.path.basename(file_path)
-
-# Function to create the CSV for QA purposes with json_file as the first column
-def write_translation_comparison_csv(en_data, all_locale_data, output_file):
+# Function to build the QA columns (json_file, key, english, one per locale) for one namespace
+def namespace_columns(json_file, en_keys, locale_files):
+    keys = list(en_keys)
+    columns = [[json_file] * len(keys), keys, list(en_keys.values())]
+    for locale_translations in locale_files:
+        columns.append([locale_translations.get(key, '') for key in keys])
+    return columns
+
+# Function to render a leaf value the way the CSV writer would (None becomes an empty string)
+def as_text(value):
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+# Writes QA columns as CSV rows, with every field quoted
+class CsvMatrixWriter:
+    def __init__(self, output_file, header):
+        self.file = open(output_file, mode='w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file, quoting=csv.QUOTE_ALL)
+        self.writer.writerow(header)
+
+    def write_columns(self, columns):
+        self.writer.writerows(zip(*columns))
+
+    def close(self):
+        self.file.close()
+
+# Writes QA columns as string record batches, to a Parquet file (one row group per batch) or an Arrow IPC file
+class ArrowMatrixWriter:
+    def __init__(self, output_file, header, output_format):
+        self.schema = pyarrow.schema([(name, pyarrow.string()) for name in header])
+        if output_format == 'parquet':
+            self.writer = pyarrow.parquet.ParquetWriter(output_file, self.schema)
+        else:
+            self.writer = pyarrow.ipc.new_file(output_file, self.schema)
+
+    def write_columns(self, columns):
+        arrays = [pyarrow.array([as_text(value) for value in column], pyarrow.string()) for column in columns]
+        self.writer.write_batch(pyarrow.record_batch(arrays, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+# Function to open the QA matrix writer for the requested output format
+def open_matrix_writer(output_file, header, output_format='csv'):
+    if output_format == 'csv':
+        return CsvMatrixWriter(output_file, header)
+    if pyarrow is None:
+        raise ImportError(f"pyarrow is required for {output_format} output (pip install pyarrow)")
+    return ArrowMatrixWriter(output_file, header, output_format)
+
+# Function to create the QA matrix with json_file as the first column
+def write_translation_comparison(en_data, all_locale_data, output_file, output_format='csv'):
     # Prepare the header: json_file, key, English, and one column for each language
     locales = sorted(all_locale_data.keys())
     header = ["json_file", "key", "english"] + locales
 
-    with open(output_file, mode='w', newline='', encoding='utf-8') as file:
-        writer = csv.writer(file, quoting=csv.QUOTE_ALL)
-        writer.writerow(header)
-
+    writer = open_matrix_writer(output_file, header, output_format)
+    try:
         # Iterate through the English data and write translations for each locale
-        for (key, json_file), en_value in en_data.items():
-            row = [json_file, key, en_value]
-            for locale in locales:
-                locale_translations = all_locale_data.get(locale, {})
-                locale_translation_value = locale_translations.get((key, json_file), '')
-                row.append(locale_translation_value)
-            writer.writerow(row)
-
-# Main function to extract data and generate the CSV
-def generate_translation_comparison(base_path, en_locale_path, output_dir):
-    # Load English data
-    en_json_files = find_json_files(en_locale_path)
-    en_data = load_english_data(en_json_files)
-
-    # Load translations for all locales
-    all_locale_data = {}
-    other_locales = [d for d in os.listdir(base_path) if os.path.isdir(os.path.join(base_path, d)) and d != 'en']
-
-    for locale in other_locales:
-        locale_path = os.path.join(base_path, locale)
-        locale_files = find_json_files(locale_path)
-        locale_data = load_locale_data(locale_files)
-        all_locale_data[locale] = locale_data
-
-    # Output the CSV file
-    output_file = os.path.join(output_dir, 'locale_translation_comparison.csv')
-    write_translation_comparison_csv(en_data, all_locale_data, output_file)
-    print(f"Translation comparison CSV written to {output_file}")
+        for json_file, en_keys in en_data.items():
+            locale_files = [all_locale_data[locale].get(json_file, {}) for locale in locales]
+            writer.write_columns(namespace_columns(json_file, en_keys, locale_files))
+    finally:
+        writer.close()
+
+# Function to write the QA matrix one namespace at a time: each JSON file is parsed across all locales,
+# written out and dropped, so peak memory is bounded by the largest namespace rather than the whole tree
+def stream_translation_comparison(base_path, en_locale_path, output_file, output_format='csv'):
+    locale_namespaces = {locale: index_namespaces(os.path.join(base_path, locale))
+                         for locale in LocaleTreeLoader(snapshot_path='').list_locales(base_path)}
+    locales = sorted(locale_namespaces)
+    header = ["json_file", "key", "english"] + locales
+
+    writer = open_matrix_writer(output_file, header, output_format)
+    try:
+        for json_file, en_paths in index_namespaces(en_locale_path).items():
+            en_keys = load_namespace(en_paths)
+            locale_files = [load_namespace(locale_namespaces[locale].get(json_file, [])) for locale in locales]
+            writer.write_columns(namespace_columns(json_file, en_keys, locale_files))
+    finally:
+        writer.close()
+
+# Main function to extract data and generate the QA matrix
+def generate_translation_comparison(base_path, en_locale_path, output_dir, loader=None, output_format='csv', stream=False):
+    output_file = os.path.join(output_dir, f'locale_translation_comparison.{output_format}')
+
+    if stream:
+        with metrics.span('stream_matrix'):
+            stream_translation_comparison(base_path, en_locale_path, output_file, output_format)
+        print(f"Translation comparison written to {output_file}")
+        return
+
+    loader = loader or LocaleTreeLoader()
+
+    with metrics.span('load_locales') as span:
+        # Load English data
+        en_data = load_locale_data(en_locale_path, loader)
+
+        # Load translations for all locales
+        all_locale_data = {}
+        for locale in loader.list_locales(base_path):
+            all_locale_data[locale] = load_locale_data(os.path.join(base_path, locale), loader)
+        loader.save()
+        span['locales'] = len(all_locale_data)
+    metrics.count('locale_files_parsed', loader.parsed)
+    metrics.count('locale_files_reused', loader.reused)
+
+    # Output the QA matrix
+    with metrics.span('write_matrix', keys=sum(len(keys) for keys in en_data.values()) * max(len(all_locale_data), 1)):
+        write_translation_comparison(en_data, all_locale_data, output_file, output_format)
+    print(f"Translation comparison written to {output_file}")
 
 # Main function to parse arguments and invoke appropriate functions
 def main():
     parser = argparse.ArgumentParser(description="Script to output translations across locales for QA.")
     parser.add_argument("--en-locale-path", required=True, help="Path to the English locale directory.")
     parser.add_argument("--base-path", required=True, help="Base path for all locales (for comparison).")
-    parser.add_argument("--output-dir", required=True, help="Directory to store the output CSV file.")
+    parser.add_argument("--output-dir", required=True, help="Directory to store the output file.")
+    parser.add_argument("--format", choices=OUTPUT_FORMATS, default='csv',
+                        help="Output format: csv (default), parquet or arrow (Arrow IPC); the latter two need pyarrow.")
+    parser.add_argument("--stream", action='store_true',
+                        help="Process one namespace JSON file at a time across all locales to bound memory use "
+                             "(bypasses the locale snapshot).")
+    add_metrics_arguments(parser)
 
     args = parser.parse_args()
 
-    generate_translation_comparison(args.base_path, args.en_locale_path, args.output_dir)
+    if args.format != 'csv' and pyarrow is None:
+        parser.error(f"--format {args.format} requires pyarrow (pip install pyarrow)")
+
+    with instrumented_run('i18n_qa', args.output_dir, args):
+        generate_translation_comparison(args.base_path, args.en_locale_path, args.output_dir,
+                                        output_format=args.format, stream=args.stream)
 
 if __name__ == "__main__":
     main()
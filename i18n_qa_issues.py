@@ -0,0 +1,182 @@
+import os
+import re
+import sys
+import json
+import argparse
+import pandas as pd
+
+# Placeholders are interpolation variables such as {{count}}; whitespace inside the braces is not significant
+PLACEHOLDER_PATTERN = r'\{\{\s*([^{}]*?)\s*\}\}'
+MATRIX_COLUMNS = ['json_file', 'key', 'english']
+ISSUE_COLUMNS = ['json_file', 'key', 'locale', 'check', 'english', 'translation', 'detail']
+CHECKS = ('empty', 'identical', 'placeholders', 'length_ratio', 'glossary')
+
+DEFAULT_MAX_LENGTH_RATIO = 2.0
+DEFAULT_MIN_LENGTH_RATIO = 0.3
+DEFAULT_MIN_RATIO_LENGTH = 10
+
+
+def load_matrix(matrix_path):
+    """Load the QA matrix written by i18n_qa.py (CSV, Parquet or Arrow) with every cell as a string."""
+    extension = os.path.splitext(matrix_path)[1].lower()
+    if extension == '.parquet':
+        matrix = pd.read_parquet(matrix_path)
+    elif extension in ('.arrow', '.feather'):
+        matrix = pd.read_feather(matrix_path)
+    else:
+        matrix = pd.read_csv(matrix_path, dtype=str, keep_default_na=False)
+    return matrix.fillna('').astype(str)
+
+
+def load_glossary(glossary_path):
+    """Load a glossary CSV with columns term, locale and translation.
+
+    An empty locale applies the entry to every locale; an empty translation means the term must be
+    kept as-is (brand and product names).
+    """
+    glossary = pd.read_csv(glossary_path, dtype=str, keep_default_na=False)
+    if 'term' not in glossary.columns:
+        raise ValueError(f"Glossary {glossary_path} has no 'term' column")
+    for column in ('locale', 'translation'):
+        if column not in glossary.columns:
+            glossary[column] = ''
+    glossary = glossary[glossary['term'].str.strip() != '']
+    glossary['translation'] = glossary['translation'].where(glossary['translation'] != '', glossary['term'])
+    return glossary
+
+
+def melt_matrix(matrix):
+    """Turn the wide matrix (one column per locale) into one row per (json_file, key, locale)."""
+    locales = [column for column in matrix.columns if column not in MATRIX_COLUMNS]
+    return matrix.melt(id_vars=MATRIX_COLUMNS, value_vars=locales, var_name='locale', value_name='translation')
+
+
+def placeholder_sets(values):
+    """Return the set of placeholder names in each value, computed once per distinct string."""
+    unique = pd.Series(values.unique())
+    sets = unique.str.findall(PLACEHOLDER_PATTERN).map(frozenset)
+    return values.map(pd.Series(sets.to_numpy(), index=unique.to_numpy()))
+
+
+def format_placeholders(names):
+    """Render a set of placeholder names for the issue detail."""
+    return ', '.join(f'{{{{{name}}}}}' for name in sorted(names)) or '(none)'
+
+
+def issues_frame(rows, mask, check, detail):
+    """Select the flagged rows and label them with the check name and a detail column."""
+    flagged = rows.loc[mask, ['json_file', 'key', 'locale', 'english', 'translation']].copy()
+    flagged['check'] = check
+    flagged['detail'] = detail[mask] if isinstance(detail, pd.Series) else detail
+    return flagged
+
+
+def find_issues(matrix, glossary=None, max_length_ratio=DEFAULT_MAX_LENGTH_RATIO,
+                min_length_ratio=DEFAULT_MIN_LENGTH_RATIO, min_ratio_length=DEFAULT_MIN_RATIO_LENGTH):
+    """Run every check over all locales at once and return a DataFrame of issues (ISSUE_COLUMNS)."""
+    rows = melt_matrix(matrix)
+    english = rows['english']
+    translation = rows['translation']
+    has_english = english.str.strip() != ''
+    is_empty = translation.str.strip() == ''
+    translated = has_english & ~is_empty
+    issues = []
+
+    issues.append(issues_frame(rows, has_english & is_empty, 'empty', 'missing translation'))
+
+    # Strings with no letters outside placeholders (numbers, symbols, "{{count}}") are expected to match
+    has_words = english.str.replace(PLACEHOLDER_PATTERN, '', regex=True).str.contains(r'[^\W\d_]', regex=True)
+    issues.append(issues_frame(rows, translated & has_words & (translation == english), 'identical',
+                               'same as English'))
+
+    en_placeholders = placeholder_sets(english)
+    translated_placeholders = placeholder_sets(translation)
+    mismatch = translated & (en_placeholders != translated_placeholders)
+    detail = ('expected ' + en_placeholders[mismatch].map(format_placeholders)
+              + ', found ' + translated_placeholders[mismatch].map(format_placeholders))
+    issues.append(issues_frame(rows, mismatch, 'placeholders', detail.reindex(rows.index)))
+
+    en_length = english.str.len()
+    translated_length = translation.str.len()
+    ratio = translated_length / en_length.where(en_length > 0)
+    measurable = translated & (en_length >= min_ratio_length)
+    outlier = measurable & ((ratio > max_length_ratio) | (ratio < min_length_ratio))
+    detail = ('length ' + translated_length.astype(str) + ' vs ' + en_length.astype(str)
+              + ' in English (ratio ' + ratio.round(2).astype(str) + ')')
+    issues.append(issues_frame(rows, outlier, 'length_ratio', detail))
+
+    if glossary is not None:
+        for term, locale, expected in glossary[['term', 'locale', 'translation']].itertuples(index=False):
+            applies = translated & english.str.contains(rf'\b{re.escape(term)}\b', case=False, regex=True)
+            if locale:
+                applies &= rows['locale'] == locale
+            violation = applies & ~translation.str.contains(expected, case=False, regex=False)
+            issues.append(issues_frame(rows, violation, 'glossary', f"'{term}' should be translated as '{expected}'"))
+
+    report = pd.concat(issues, ignore_index=True)
+    report['check'] = pd.Categorical(report['check'], categories=CHECKS)
+    report = report.sort_values(['json_file', 'key', 'locale', 'check'], kind='stable')
+    report['check'] = report['check'].astype(str)
+    return report[ISSUE_COLUMNS].reset_index(drop=True)
+
+
+def summarize_issues(report, matrix):
+    """Return issue counts per check and per locale, for dashboards and CI gates."""
+    locales = [column for column in matrix.columns if column not in MATRIX_COLUMNS]
+    by_locale = report.groupby(['locale', 'check']).size()
+    return {
+        'keys': len(matrix),
+        'locales': len(locales),
+        'issues': len(report),
+        'by_check': {check: int((report['check'] == check).sum()) for check in CHECKS},
+        'by_locale': {locale: {check: int(count) for check, count in by_locale[locale].items()}
+                      for locale in locales if locale in by_locale.index.get_level_values(0)},
+    }
+
+
+def write_issue_report(report, summary, output_dir):
+    """Write the issues CSV and the JSON summary, returning their paths."""
+    os.makedirs(output_dir, exist_ok=True)
+    issues_path = os.path.join(output_dir, 'translation_qa_issues.csv')
+    summary_path = os.path.join(output_dir, 'translation_qa_summary.json')
+    report.to_csv(issues_path, index=False, encoding='utf-8')
+    with open(summary_path, 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    return issues_path, summary_path
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Flag translation quality issues across every locale of the QA matrix.')
+    parser.add_argument('--matrix', default=os.path.join('locale_comparison', 'locale_translation_comparison.csv'),
+                        help='QA matrix from i18n_qa.py: .csv, .parquet or .arrow (default: locale_comparison/locale_translation_comparison.csv)')
+    parser.add_argument('--output-dir', default='locale_comparison',
+                        help='Directory for translation_qa_issues.csv and translation_qa_summary.json (default: locale_comparison)')
+    parser.add_argument('--glossary', help='CSV of glossary terms with columns term, locale (optional) and translation (optional)')
+    parser.add_argument('--max-length-ratio', type=float, default=DEFAULT_MAX_LENGTH_RATIO,
+                        help=f'Flag translations longer than this multiple of the English length (default: {DEFAULT_MAX_LENGTH_RATIO})')
+    parser.add_argument('--min-length-ratio', type=float, default=DEFAULT_MIN_LENGTH_RATIO,
+                        help=f'Flag translations shorter than this fraction of the English length (default: {DEFAULT_MIN_LENGTH_RATIO})')
+    parser.add_argument('--min-ratio-length', type=int, default=DEFAULT_MIN_RATIO_LENGTH,
+                        help=f'Only check length ratios for English strings at least this long (default: {DEFAULT_MIN_RATIO_LENGTH})')
+    parser.add_argument('--fail-on-issues', action='store_true', help='Exit with status 1 if any issue is found')
+    args = parser.parse_args()
+
+    matrix = load_matrix(args.matrix)
+    glossary = load_glossary(args.glossary) if args.glossary else None
+    report = find_issues(matrix, glossary, args.max_length_ratio, args.min_length_ratio, args.min_ratio_length)
+    summary = summarize_issues(report, matrix)
+    issues_path, summary_path = write_issue_report(report, summary, args.output_dir)
+
+    counts = ', '.join(f"{count} {check}" for check, count in summary['by_check'].items())
+    print(f"Found {summary['issues']} issues across {summary['locales']} locales and {summary['keys']} keys ({counts})")
+    print(f"Issues written to {issues_path}, summary to {summary_path}")
+
+    if args.fail_on_issues and summary['issues']:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+# Example usage:
+# python i18n_qa_issues.py --matrix locale_comparison/locale_translation_comparison.csv --output-dir locale_comparison --glossary glossary.csv
@@ -0,0 +1,193 @@
+import re
+import time
+import random
+import asyncio
+from collections import deque
+
+WINDOW_SECONDS = 60
+# How often a waiting request re-checks whether it may start
+POLL_INTERVAL = 0.05
+DEFAULT_MAX_RETRIES = 6
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+
+DURATION_PATTERN = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def parse_duration(value):
+    """Parse a rate-limit reset duration such as '20ms', '1.5s' or '6m0s' into seconds (None if unparseable)."""
+    if value is None:
+        return None
+    value = str(value).strip()
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def header_number(headers, name):
+    """Read a numeric header, returning None when it is absent or malformed."""
+    value = headers.get(name) if headers is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def retry_after_seconds(headers):
+    """Return the server's requested wait from retry-after-ms or retry-after, if any."""
+    milliseconds = header_number(headers, 'retry-after-ms')
+    if milliseconds is not None:
+        return milliseconds / 1000
+    return header_number(headers, 'retry-after')
+
+
+class RateController:
+    """Schedules API requests within requests- and tokens-per-minute budgets.
+
+    Concurrency follows AIMD: every successful request widens the in-flight window by about one request per
+    window's worth of successes, and a rate-limited response halves it. Budgets not given up front are taken
+    from the x-ratelimit-* response headers, and their remaining/reset values hold requests back before the
+    server has to refuse them. Used from a single thread or a single event loop.
+    """
+
+    def __init__(self, max_concurrency=1, requests_per_minute=None, tokens_per_minute=None,
+                 max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY, seed=None):
+        self.max_concurrency = max(max_concurrency, 1)
+        self.limit = float(self.max_concurrency)
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.random = random.Random(seed)
+        self.in_flight = 0
+        # Each started request is a [start time, tokens] ticket, kept while it is under a minute old
+        self.window = deque()
+        self.blocked_until = 0.0
+        self.last_decrease = 0.0
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.stats = {'requests': 0, 'rate_limited': 0, 'retries': 0, 'waited_s': 0.0}
+
+    def prune(self, now):
+        while self.window and self.window[0][0] <= now - WINDOW_SECONDS:
+            self.window.popleft()
+
+    def window_delay(self, budget, amount, now, weigh):
+        """Seconds until amount more fits into the last minute's usage, where weigh(ticket) is a request's share."""
+        used = sum(weigh(ticket) for ticket in self.window)
+        if used + amount <= budget or not self.window:
+            return 0
+        for ticket in self.window:
+            used -= weigh(ticket)
+            if used + amount <= budget:
+                return ticket[0] + WINDOW_SECONDS - now
+        return WINDOW_SECONDS
+
+    def delay(self, tokens, now):
+        """Seconds a request of about tokens tokens has to wait before it may start; 0 if it may start now."""
+        self.prune(now)
+        delays = [self.blocked_until - now]
+        if self.in_flight >= int(self.limit):
+            delays.append(POLL_INTERVAL)
+        if self.requests_per_minute:
+            delays.append(self.window_delay(self.requests_per_minute, 1, now, lambda ticket: 1))
+        if self.tokens_per_minute:
+            delays.append(self.window_delay(self.tokens_per_minute, tokens, now, lambda ticket: ticket[1]))
+        if self.remaining_requests is not None and self.remaining_requests < 1:
+            delays.append(self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens:
+            delays.append(self.tokens_reset_at - now)
+        return max(max(delays), 0)
+
+    def start(self, tokens, now):
+        ticket = [now, tokens]
+        self.in_flight += 1
+        self.window.append(ticket)
+        if self.remaining_requests is not None:
+            self.remaining_requests -= 1
+        if self.remaining_tokens is not None:
+            self.remaining_tokens -= tokens
+        self.stats['requests'] += 1
+        return ticket
+
+    def acquire(self, tokens):
+        """Block until a request of about tokens tokens may be sent; returns the ticket to pass to release."""
+        started = time.monotonic()
+        while (wait := self.delay(tokens, time.monotonic())) > 0:
+            time.sleep(min(wait, 1.0))
+        self.stats['waited_s'] += time.monotonic() - started
+        return self.start(tokens, time.monotonic())
+
+    async def acquire_async(self, tokens):
+        """Async variant of acquire for requests sharing one event loop."""
+        started = time.monotonic()
+        while (wait := self.delay(tokens, time.monotonic())) > 0:
+            await asyncio.sleep(min(wait, 1.0))
+        self.stats['waited_s'] += time.monotonic() - started
+        return self.start(tokens, time.monotonic())
+
+    def update_from_headers(self, headers, now):
+        """Adopt the budgets and remaining allowance the server reports in its x-ratelimit-* headers."""
+        if not headers:
+            return
+        limit_requests = header_number(headers, 'x-ratelimit-limit-requests')
+        limit_tokens = header_number(headers, 'x-ratelimit-limit-tokens')
+        if limit_requests and not self.requests_per_minute:
+            self.requests_per_minute = limit_requests
+        if limit_tokens and not self.tokens_per_minute:
+            self.tokens_per_minute = limit_tokens
+
+        remaining_requests = header_number(headers, 'x-ratelimit-remaining-requests')
+        if remaining_requests is not None:
+            self.remaining_requests = remaining_requests
+            self.requests_reset_at = now + (parse_duration(headers.get('x-ratelimit-reset-requests')) or 0)
+        remaining_tokens = header_number(headers, 'x-ratelimit-remaining-tokens')
+        if remaining_tokens is not None:
+            self.remaining_tokens = remaining_tokens
+            self.tokens_reset_at = now + (parse_duration(headers.get('x-ratelimit-reset-tokens')) or 0)
+
+    def release(self, ticket, outcome, headers=None, tokens=None):
+        """Finish a request. outcome is 'ok', 'rate_limited' or 'error'; tokens is the actual usage if known."""
+        now = time.monotonic()
+        self.in_flight -= 1
+        if tokens is not None:
+            ticket[1] = tokens
+        self.update_from_headers(headers, now)
+
+        if outcome == 'ok':
+            self.limit = min(self.limit + 1 / self.limit, self.max_concurrency)
+        elif outcome == 'rate_limited':
+            self.stats['rate_limited'] += 1
+            # Halve once per congestion event: requests already in flight when the window shrank do not count again
+            if ticket[0] >= self.last_decrease:
+                self.limit = max(self.limit / 2, 1.0)
+                self.last_decrease = now
+
+    def backoff(self, attempt, headers=None, rate_limited=False):
+        """Return the wait before retry number attempt, honouring retry-after and otherwise using full jitter.
+
+        A rate-limited response pauses every request, since the limit applies to the whole account.
+        """
+        self.stats['retries'] += 1
+        retry_after = retry_after_seconds(headers)
+        if retry_after is not None:
+            wait = retry_after + self.random.uniform(0, self.base_delay / 4)
+        else:
+            wait = self.random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        if rate_limited:
+            self.blocked_until = max(self.blocked_until, time.monotonic() + wait)
+        return wait
+
+    def summary(self):
+        return (f"Rate control: {self.stats['requests']} requests, {self.stats['rate_limited']} rate limited, "
+                f"{self.stats['retries']} retried, {self.stats['waited_s']:.1f}s waiting for budget, "
+                f"concurrency window {self.limit:.1f}/{self.max_concurrency}")
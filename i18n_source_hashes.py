@@ -0,0 +1,63 @@
+import os
+import json
+import hashlib
+
+# Sidecar next to the locale directories recording, for every translated key, a hash of the English text it was
+# translated from. When English changes afterwards the hashes no longer match and the translation is stale.
+# It lives in the project's locale directory, where 'compare' reads it, and is committed with the locales.
+SIDECAR_NAME = '.i18n_source_hashes.json'
+
+
+def hash_source(value):
+    """Return a short, stable hash of an English leaf value."""
+    text = value if isinstance(value, str) else json.dumps(value, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()[:16]
+
+
+def sidecar_path(base_path):
+    """Return the default path of the sidecar for the locales under base_path."""
+    return os.path.join(base_path, SIDECAR_NAME)
+
+
+def load_source_hashes(path):
+    """Load {locale: {label_key: source hash}}, returning an empty mapping if the sidecar is missing or unreadable."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        print(f"Warning: Ignoring unreadable source hash sidecar {path}")
+        return {}
+
+
+def save_source_hashes(path, source_hashes):
+    """Atomically write the sidecar, with locales and keys sorted so it diffs cleanly in version control."""
+    temp_path = f"{path}.tmp"
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(source_hashes, f, ensure_ascii=False, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(temp_path, path)
+
+
+def record_source_hashes(path, records):
+    """Merge (locale, label_key, English source value) records into the sidecar at path."""
+    if not records:
+        return
+    source_hashes = load_source_hashes(path)
+    for locale, label_key, source_value in records:
+        source_hashes.setdefault(locale, {})[label_key] = hash_source(source_value)
+    save_source_hashes(path, source_hashes)
+
+
+def stale_keys(en_data, locale_data, locale_hashes, missing_keys=()):
+    """Return the keys whose translation was made from English text that has since changed.
+
+    en_data and locale_data are flat {key: KeyEntry} mappings. Keys without a recorded hash are never stale,
+    since there is nothing to compare against, and missing keys are already reported as missing.
+    """
+    return {
+        key for key, source_hash in locale_hashes.items()
+        if key in en_data and key in locale_data and key not in missing_keys
+        and source_hash != hash_source(en_data[key].value)
+    }
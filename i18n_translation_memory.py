@@ -0,0 +1,99 @@
+import os
+import time
+import sqlite3
+import hashlib
+
+DEFAULT_TTL_DAYS = 90
+
+
+def hash_text(text):
+    """Return the sha256 hex digest of a string."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class TranslationMemory:
+    """Local SQLite store of previous translations, keyed by English text, locale, model and prompt hash."""
+
+    def __init__(self, path, ttl_days=DEFAULT_TTL_DAYS, max_entries=None):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400 if ttl_days else None
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.tokens_saved = 0
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                cache_key TEXT PRIMARY KEY,
+                en TEXT NOT NULL,
+                locale TEXT NOT NULL,
+                model TEXT NOT NULL,
+                prompt_hash TEXT NOT NULL,
+                translated_value TEXT NOT NULL,
+                tokens INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL
+            )
+        """)
+        self.connection.commit()
+        self.evict()
+
+    @staticmethod
+    def cache_key(en, locale, model, prompt_hash):
+        """Content address of a translation."""
+        return hash_text("\x1f".join([en, locale, model, prompt_hash]))
+
+    def lookup(self, en, locale, model, prompt_hash):
+        """Return the stored translation for the English text, or None on a miss."""
+        cache_key = self.cache_key(en, locale, model, prompt_hash)
+        row = self.connection.execute(
+            "SELECT translated_value, tokens, created_at FROM translations WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+
+        now = time.time()
+        if row is None or (self.ttl_seconds and row[2] < now - self.ttl_seconds):
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.tokens_saved += row[1]
+        self.connection.execute("UPDATE translations SET last_used_at = ? WHERE cache_key = ?", (now, cache_key))
+        return row[0]
+
+    def store(self, en, locale, model, prompt_hash, translated_value, tokens):
+        """Store a translation along with the estimated number of tokens it cost."""
+        now = time.time()
+        self.connection.execute(
+            "INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (self.cache_key(en, locale, model, prompt_hash), en, locale, model, prompt_hash,
+             translated_value, tokens, now, now)
+        )
+        self.stored += 1
+
+    def evict(self):
+        """Drop entries older than the TTL, then the least recently used entries beyond max_entries."""
+        if self.ttl_seconds:
+            self.connection.execute("DELETE FROM translations WHERE created_at < ?", (time.time() - self.ttl_seconds,))
+        if self.max_entries is not None:
+            self.connection.execute("""
+                DELETE FROM translations WHERE cache_key NOT IN (
+                    SELECT cache_key FROM translations ORDER BY last_used_at DESC LIMIT ?
+                )
+            """, (self.max_entries,))
+        self.connection.commit()
+
+    def close(self):
+        """Apply the eviction policy and close the database."""
+        self.evict()
+        self.connection.close()
+
+    def summary(self):
+        """Return a one-line summary of this run's cache usage."""
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0
+        return (f"Translation memory: {self.hits} hits, {self.misses} misses ({hit_rate:.0f}% hit rate), "
+                f"{self.stored} stored, ~{self.tokens_saved} tokens saved")
@@ -1,10 +1,18 @@
 import pandas as pd
 import os
+import time
+import asyncio
 import traceback
-from openai import OpenAI, OpenAIError
+from openai import APIConnectionError, AsyncOpenAI, InternalServerError, OpenAI, OpenAIError, RateLimitError
 import json
+import fnmatch
 import argparse
 from dotenv import load_dotenv
+from i18n_batch import run_batch
+from i18n_journal import JOURNAL_NAME, TranslationJournal
+from i18n_metrics import add_metrics_arguments, instrumented_run, metrics
+from i18n_rate_control import DEFAULT_MAX_RETRIES, RateController
+from i18n_translation_memory import DEFAULT_TTL_DAYS, TranslationMemory, hash_text
 load_dotenv()
 
 def parse_arguments():
@@ -14,56 +22,123 @@ def parse_arguments():
                        help='Input directory containing comparison CSV files (default: locale_comparison)')
     parser.add_argument('--output-dir', default='locale_comparison',
                        help='Output directory for translated CSV files (default: locale_comparison)')
+    add_translation_arguments(parser)
+    add_metrics_arguments(parser)
     return parser.parse_args()
 
+def add_translation_arguments(parser):
+    """Add the options that control how translations are requested (shared with i18n_pipeline.py)."""
+    parser.add_argument('--concurrency', type=int, default=1,
+                       help='Number of translation requests to run in parallel (default: 1, sequential)')
+    parser.add_argument('--max-input-tokens', type=int, default=DEFAULT_MAX_INPUT_TOKENS,
+                       help=f'Estimated input token budget per translation request (default: {DEFAULT_MAX_INPUT_TOKENS})')
+    parser.add_argument('--max-output-tokens', type=int, default=DEFAULT_MAX_OUTPUT_TOKENS,
+                       help=f'Estimated output token budget per translation request (default: {DEFAULT_MAX_OUTPUT_TOKENS})')
+    parser.add_argument('--batch', action='store_true',
+                       help='Submit all translation requests as one OpenAI Batch API job and poll until it completes')
+    parser.add_argument('--batch-poll-interval', type=float, default=30,
+                       help='Seconds between batch status checks (default: 30)')
+    parser.add_argument('--translation-memory', default='translation_memory.sqlite',
+                       help='SQLite translation memory reused across runs and projects (default: translation_memory.sqlite)')
+    parser.add_argument('--no-translation-memory', action='store_true',
+                       help='Translate every phrase through the API without reading or writing the translation memory')
+    parser.add_argument('--tm-ttl-days', type=float, default=DEFAULT_TTL_DAYS,
+                       help=f'Expire translation memory entries older than this many days (default: {DEFAULT_TTL_DAYS}, 0 keeps them forever)')
+    parser.add_argument('--tm-max-entries', type=int, default=None,
+                       help='Keep at most this many translation memory entries, evicting the least recently used')
+    parser.add_argument('--locales-per-request', type=int, default=1,
+                       help='Ask for up to this many target locales in one request, sharing the prompt and English input '
+                            '(default: 1, one locale per request; not used with --batch)')
+    parser.add_argument('--no-dedupe', action='store_true',
+                       help='Translate every key separately instead of once per distinct English text in each locale')
+    parser.add_argument('--dedupe-exclude', action='append', default=[], metavar='PATTERN',
+                       help='Glob of label keys whose translation depends on context and is never shared, e.g. "auth.*" (repeatable)')
+    parser.add_argument('--resume', action='store_true',
+                       help=f'Reuse the translations recorded in <output-dir>/{JOURNAL_NAME} by an interrupted run '
+                            '(without it, the journal is started afresh)')
+    parser.add_argument('--requests-per-minute', type=int, default=None,
+                       help='Requests-per-minute budget (default: taken from the API\'s x-ratelimit headers)')
+    parser.add_argument('--tokens-per-minute', type=int, default=None,
+                       help='Tokens-per-minute budget (default: taken from the API\'s x-ratelimit headers)')
+    parser.add_argument('--max-retries', type=int, default=DEFAULT_MAX_RETRIES,
+                       help=f'Retries per request after a 429, 5xx or connection error, with jittered backoff (default: {DEFAULT_MAX_RETRIES})')
+    parser.add_argument('--base-url', default=None,
+                       help='OpenAI-compatible API base URL, e.g. http://127.0.0.1:8765/v1 for i18n_mock_server.py '
+                            '(default: OPENAI_BASE_URL or the OpenAI API)')
+
+
+def rate_controller_from_args(args):
+    """Build the RateController for a run from the translation options."""
+    return RateController(args.concurrency, args.requests_per_minute, args.tokens_per_minute, args.max_retries)
+
+
+def configure_api_endpoint(base_url):
+    """Point every OpenAI client created afterwards at base_url.
+
+    The clients read OPENAI_BASE_URL themselves, so setting it covers the sync, async and batch paths alike.
+    A local endpoint such as the mock server needs no real key, so a placeholder is used if none is set.
+    """
+    if not base_url:
+        return
+    os.environ['OPENAI_BASE_URL'] = base_url
+    if base_url.startswith(('http://127.0.0.1', 'http://localhost')):
+        os.environ.setdefault('OPENAI_API_KEY', 'mock')
+
 def load_csv_files(english_path, locale_comparison_path):
     english_labels_df = pd.read_csv(english_path)
     locale_key_comparison_df = pd.read_csv(locale_comparison_path)
     return english_labels_df, locale_key_comparison_df
 
 
-# Function to create the GPT-4 prompt and send a batch translation request
-def gpt_translate(translation_list, locale):
-    # Map locales to the full names of their languages
-    locale_to_language = {
-        'en': 'English',
-        'ja': 'Japanese',
-        'ko': 'Korean',
-        'zh': 'Chinese',
-        'cn': 'Chinese',
-        'ru': 'Russian',
-        'hi': 'Hindi',
-        'es': 'Spanish',
-        'fr': 'French',
-        'de': 'German',
-        'it': 'Italian',
-        'pt': 'Portuguese',
-        'tr': 'Turkish',
-        'nl': 'Dutch',
-        'pl': 'Polish',
-        'sv': 'Swedish',
-        'da': 'Danish',
-        'fi': 'Finnish',
-        'no': 'Norwegian',
-        'cs': 'Czech',
-        'hu': 'Hungarian',
-        'el': 'Greek',
-        'th': 'Thai',
-        'vi': 'Vietnamese',
-        'id': 'Indonesian',
-        'ms': 'Malay',
-        'fil': 'Filipino',
-        'ar': 'Arabic',
-        'he': 'Hebrew',
-        'af': 'Afrikaans',
-    }
+MODEL = "gpt-4o-2024-08-06"
+REQUEST_TIMEOUT = 120
 
-    # Construct system prompt using f-string
-    system_prompt = """
-    Task:
-    Translate the following short text phrases into %s, ensuring accurate and context-appropriate translations for UI elements such as button labels and section titles.
+# Per-request token budgets used to split a locale's phrases into chunks
+DEFAULT_MAX_INPUT_TOKENS = 6000
+DEFAULT_MAX_OUTPUT_TOKENS = 4000
+# Rough allowance for the JSON wrapper around each returned translation
+OUTPUT_TOKENS_PER_ITEM = 20
+# Translations can need more tokens than the English source (e.g. CJK, Hindi)
+OUTPUT_EXPANSION = 2
+# Attempts per chunk; later attempts only resend the phrases that are still missing
+MAX_ATTEMPTS = 3
+
+# Map locales to the full names of their languages
+LOCALE_TO_LANGUAGE = {
+    'en': 'English',
+    'ja': 'Japanese',
+    'ko': 'Korean',
+    'zh': 'Chinese',
+    'cn': 'Chinese',
+    'ru': 'Russian',
+    'hi': 'Hindi',
+    'es': 'Spanish',
+    'fr': 'French',
+    'de': 'German',
+    'it': 'Italian',
+    'pt': 'Portuguese',
+    'tr': 'Turkish',
+    'nl': 'Dutch',
+    'pl': 'Polish',
+    'sv': 'Swedish',
+    'da': 'Danish',
+    'fi': 'Finnish',
+    'no': 'Norwegian',
+    'cs': 'Czech',
+    'hu': 'Hungarian',
+    'el': 'Greek',
+    'th': 'Thai',
+    'vi': 'Vietnamese',
+    'id': 'Indonesian',
+    'ms': 'Malay',
+    'fil': 'Filipino',
+    'ar': 'Arabic',
+    'he': 'Hebrew',
+    'af': 'Afrikaans',
+}
 
-    Context:
+# Context and glossary shared by the single- and multi-locale prompts
+PROMPT_CONTEXT = """    Context:
     These phrases belong to a software platform related to cryptocurrency and blockchain. Use the following specific translations for key technical terms and jargon.
     
     Glossary of Specific Terms:
@@ -88,54 +163,567 @@ def gpt_translate(translation_list, locale):
     Visual Mode: Refers to a display mode that changes how information is shown visually in the interface.
     Tor: Refers to The Onion Router, a privacy-focused network for anonymous communication.
 
-    Instructions:
+"""
+
+# Function to construct the system prompt for a target locale
+def build_system_prompt(locale):
+    return """
+    Task:
+    Translate the following short text phrases into %s, ensuring accurate and context-appropriate translations for UI elements such as button labels and section titles.
+
+%s    Instructions:
     Do not translate technical terms like GPU, CPU, hash rate, or product names like Tari Universe. 
     Maintain clarity for UI elements such as button labels and headings.
     Output your result as a JSON array with the format:
     {"result": [{ "key": "<label_key>", "en": "<English value>", "translated_value": "<translated_value>", "locale": "%s" }]}}
-    """ % (locale_to_language[locale], locale)
+    """ % (LOCALE_TO_LANGUAGE[locale], PROMPT_CONTEXT, locale)
+
+# System prompt for multi-locale requests. It names no locale, so it is the same for every request and forms a
+# stable prefix for provider-side prompt caching; the target locales are sent in the user message instead
+MULTI_LOCALE_SYSTEM_PROMPT = """
+    Task:
+    Translate the following short text phrases into each of the target languages listed in the input, ensuring accurate and context-appropriate translations for UI elements such as button labels and section titles.
 
+%s    Instructions:
+    Do not translate technical terms like GPU, CPU, hash rate, or product names like Tari Universe. 
+    Maintain clarity for UI elements such as button labels and headings.
+    The input is a JSON object with "target_locales", mapping locale codes to languages, and "phrases", a list of phrases with a "key" and a "text".
+    Translate every phrase into every target language and output your result as a JSON object with the format:
+    {"result": {"<locale code>": [{ "key": "<label_key>", "translated_value": "<translated_value>" }]}}
+    """ % PROMPT_CONTEXT
 
-    # Prepare translation input list
+# Function to build the chat messages for a batch of phrases
+def build_messages(translation_list, locale):
     translation_input = [{"key": item['label_key'], "text": item['value']} for item in translation_list]
-    print(f"Translating {len(translation_input)} phrases to {locale_to_language[locale]}...")
+    return [
+        {"role": "system", "content": build_system_prompt(locale)},
+        {"role": "user", "content": json.dumps(translation_input)}
+    ]
+
+# Function to build the chat messages asking for several locales at once, with the static system prompt first
+def build_multi_locale_messages(translation_list, locales):
+    translation_input = {
+        "target_locales": {locale: LOCALE_TO_LANGUAGE[locale] for locale in locales},
+        "phrases": [{"key": item['label_key'], "text": item['value']} for item in translation_list],
+    }
+    return [
+        {"role": "system", "content": MULTI_LOCALE_SYSTEM_PROMPT},
+        {"role": "user", "content": json.dumps(translation_input)}
+    ]
+
+# Function to build the chat completion request body for a multi-locale batch of phrases
+def build_multi_locale_request_body(translation_list, locales):
+    return {
+        "model": MODEL,
+        "response_format": {"type": "json_object"},
+        "messages": build_multi_locale_messages(translation_list, locales),
+        "temperature": 0,
+    }
+
+# Function to build the chat completion request body for a batch of phrases
+def build_request_body(translation_list, locale):
+    return {
+        "model": MODEL,
+        "response_format": {"type": "json_object"},
+        "messages": build_messages(translation_list, locale),
+        "temperature": 0,
+    }
+
+# Function to extract the translation list from the content of a chat completion
+def parse_translation_content(raw_result, finish_reason=None):
+    # Check if the result is empty or malformed
+    if not raw_result:
+        print("Error: Empty response from GPT-4")
+        return None
+    if finish_reason == 'length':
+        print("Error: Response from GPT-4 was truncated at the output token limit")
+        return None
+
+    # Try parsing the result
+    return json.loads(raw_result)["result"]
+
+# Function to extract the translation list from a chat completion response
+def parse_translation_response(response):
+    choice = response.choices[0]
+    return parse_translation_content(choice.message.content, getattr(choice, 'finish_reason', None))
+
+# Function to estimate the tokens a translation request will use, for the tokens-per-minute budget
+def estimate_request_tokens(translation_list, locale):
+    item_tokens = [estimate_item_tokens(item) for item in translation_list]
+    return (estimate_tokens(build_system_prompt(locale)) + sum(input_tokens for input_tokens, _ in item_tokens)
+            + sum(output_tokens for _, output_tokens in item_tokens))
+
+# Function to estimate the tokens a multi-locale request will use
+def estimate_multi_locale_request_tokens(translation_list, locales):
+    item_tokens = [estimate_item_tokens(item) for item in translation_list]
+    return (estimate_tokens(MULTI_LOCALE_SYSTEM_PROMPT) + sum(input_tokens for input_tokens, _ in item_tokens)
+            + sum(output_tokens for _, output_tokens in item_tokens) * len(locales))
+
+# Function to classify an API error for the rate controller: (outcome, response headers, whether to retry)
+def classify_api_error(error):
+    headers = getattr(getattr(error, 'response', None), 'headers', None)
+    if isinstance(error, RateLimitError):
+        # An exhausted quota will not recover by waiting
+        return 'rate_limited', headers, getattr(error, 'code', None) != 'insufficient_quota'
+    return 'error', headers, isinstance(error, (InternalServerError, APIConnectionError))
+
+# Function to send one chat completion through the rate controller, retrying throttled and failed requests
+def send_chat_completion(client, body, tokens, controller):
+    if controller is None:
+        return client.chat.completions.create(**body, timeout=REQUEST_TIMEOUT)
+
+    for retry in range(controller.max_retries + 1):
+        ticket = controller.acquire(tokens)
+        try:
+            raw_response = client.chat.completions.with_raw_response.create(**body, timeout=REQUEST_TIMEOUT)
+        except OpenAIError as e:
+            outcome, headers, retryable = classify_api_error(e)
+            controller.release(ticket, outcome, headers)
+            if not retryable or retry == controller.max_retries:
+                raise
+            wait = controller.backoff(retry, headers, outcome == 'rate_limited')
+            print(f"Request failed ({type(e).__name__}), retrying in {wait:.1f}s...")
+            time.sleep(wait)
+            continue
+        response = raw_response.parse()
+        controller.release(ticket, 'ok', raw_response.headers, getattr(response.usage, 'total_tokens', None))
+        return response
+
+# Async variant of send_chat_completion
+async def send_chat_completion_async(client, body, tokens, controller):
+    if controller is None:
+        return await client.chat.completions.create(**body, timeout=REQUEST_TIMEOUT)
+
+    for retry in range(controller.max_retries + 1):
+        ticket = await controller.acquire_async(tokens)
+        try:
+            raw_response = await client.chat.completions.with_raw_response.create(**body, timeout=REQUEST_TIMEOUT)
+        except OpenAIError as e:
+            outcome, headers, retryable = classify_api_error(e)
+            controller.release(ticket, outcome, headers)
+            if not retryable or retry == controller.max_retries:
+                raise
+            wait = controller.backoff(retry, headers, outcome == 'rate_limited')
+            print(f"Request failed ({type(e).__name__}), retrying in {wait:.1f}s...")
+            await asyncio.sleep(wait)
+            continue
+        response = raw_response.parse()
+        controller.release(ticket, 'ok', raw_response.headers, getattr(response.usage, 'total_tokens', None))
+        return response
+
+# Function to create the GPT-4 prompt and send a batch translation request
+def gpt_translate(translation_list, locale, client=None, attempt=1, controller=None):
+    print(f"Translating {len(translation_list)} phrases to {LOCALE_TO_LANGUAGE[locale]}...")
+    started = time.perf_counter()
+    response, status = None, 'ok'
 
     try:
-        client = OpenAI()
-        response = client.chat.completions.create(
-            model="gpt-4o-2024-08-06",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": json.dumps(translation_input)}
-            ],
-            temperature=0,
-            timeout=120,
-        )
-           # Print the raw response for debugging
-        raw_result = response.choices[0].message.content
-
-        # Check if the result is empty or malformed
-        if not raw_result:
-            print("Error: Empty response from GPT-4")
-            return None
+        client = client or OpenAI()
+        response = send_chat_completion(client, build_request_body(translation_list, locale),
+                                        estimate_request_tokens(translation_list, locale), controller)
+        translations = parse_translation_response(response)
+        if translations is None:
+            status = 'invalid_response'
+        return translations
+
+    except OpenAIError as e:
+        status = 'api_error'
+        print(f"OpenAI API Error: {str(e)}")
+        return None
+    except json.JSONDecodeError as e:
+        status = 'json_error'
+        print(f"JSON Error: {str(e)}")
+        return None
+    finally:
+        metrics.api_call(locale, len(translation_list), time.perf_counter() - started,
+                         getattr(response, 'usage', None), status, attempt)
 
-        # Try parsing the result
-        return json.loads(raw_result)["result"]
+# Async variant of gpt_translate that shares one AsyncOpenAI client across concurrent requests
+async def gpt_translate_async(translation_list, locale, client, attempt=1, controller=None):
+    print(f"Translating {len(translation_list)} phrases to {LOCALE_TO_LANGUAGE[locale]}...")
+    started = time.perf_counter()
+    response, status = None, 'ok'
+
+    try:
+        response = await send_chat_completion_async(client, build_request_body(translation_list, locale),
+                                                    estimate_request_tokens(translation_list, locale), controller)
+        translations = parse_translation_response(response)
+        if translations is None:
+            status = 'invalid_response'
+        return translations
 
     except OpenAIError as e:
+        status = 'api_error'
+        print(f"OpenAI API Error ({locale}): {str(e)}")
+        return None
+    except json.JSONDecodeError as e:
+        status = 'json_error'
+        print(f"JSON Error ({locale}): {str(e)}")
+        return None
+    finally:
+        metrics.api_call(locale, len(translation_list), time.perf_counter() - started,
+                         getattr(response, 'usage', None), status, attempt, mode='async')
+
+# Function to request several locales in one multi-locale request, returning {locale: [translations]} or None
+def gpt_translate_multi(translation_list, locales, client=None, controller=None):
+    print(f"Translating {len(translation_list)} phrases to {len(locales)} languages ({', '.join(locales)})...")
+    started = time.perf_counter()
+    response, status = None, 'ok'
+
+    try:
+        client = client or OpenAI()
+        response = send_chat_completion(client, build_multi_locale_request_body(translation_list, locales),
+                                        estimate_multi_locale_request_tokens(translation_list, locales), controller)
+        translations = parse_translation_response(response)
+        if not isinstance(translations, dict):
+            status = 'invalid_response'
+            return None
+        return translations
+
+    except OpenAIError as e:
+        status = 'api_error'
         print(f"OpenAI API Error: {str(e)}")
         return None
     except json.JSONDecodeError as e:
+        status = 'json_error'
         print(f"JSON Error: {str(e)}")
         return None
+    finally:
+        metrics.api_call('multi', len(translation_list) * len(locales), time.perf_counter() - started,
+                         getattr(response, 'usage', None), status, mode='multi')
+
+# Async variant of gpt_translate_multi
+async def gpt_translate_multi_async(translation_list, locales, client, controller=None):
+    print(f"Translating {len(translation_list)} phrases to {len(locales)} languages ({', '.join(locales)})...")
+    started = time.perf_counter()
+    response, status = None, 'ok'
+
+    try:
+        response = await send_chat_completion_async(client, build_multi_locale_request_body(translation_list, locales),
+                                                     estimate_multi_locale_request_tokens(translation_list, locales), controller)
+        translations = parse_translation_response(response)
+        if not isinstance(translations, dict):
+            status = 'invalid_response'
+            return None
+        return translations
+
+    except OpenAIError as e:
+        status = 'api_error'
+        print(f"OpenAI API Error ({', '.join(locales)}): {str(e)}")
+        return None
+    except json.JSONDecodeError as e:
+        status = 'json_error'
+        print(f"JSON Error ({', '.join(locales)}): {str(e)}")
+        return None
+    finally:
+        metrics.api_call('multi', len(translation_list) * len(locales), time.perf_counter() - started,
+                         getattr(response, 'usage', None), status, mode='multi')
+
+# Function to roughly estimate the number of tokens in a piece of text (about 4 characters per token)
+def estimate_tokens(text):
+    return len(str(text)) // 4 + 1
+
+# Function to estimate the input and output tokens a single phrase adds to a request
+def estimate_item_tokens(item):
+    input_tokens = estimate_tokens(json.dumps({"key": item['label_key'], "text": item['value']}))
+    output_tokens = (OUTPUT_TOKENS_PER_ITEM + estimate_tokens(item['label_key'])
+                     + estimate_tokens(item['value']) * (1 + OUTPUT_EXPANSION))
+    return input_tokens, output_tokens
 
+# Function to split a locale's phrases into chunks that fit the input and output token budgets
+# (for a multi-locale request, pass its system prompt and the number of locales each phrase is returned in)
+def chunk_translation_list(translation_list, locale, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                           max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS, system_prompt=None, output_locales=1):
+    input_budget = max(max_input_tokens - estimate_tokens(system_prompt or build_system_prompt(locale)), 1)
+    chunks = []
+    chunk, input_tokens, output_tokens = [], 0, 0
 
+    for item in translation_list:
+        item_input_tokens, item_output_tokens = estimate_item_tokens(item)
+        item_output_tokens *= output_locales
+
+        if chunk and (input_tokens + item_input_tokens > input_budget
+                      or output_tokens + item_output_tokens > max_output_tokens):
+            chunks.append(chunk)
+            chunk, input_tokens, output_tokens = [], 0, 0
+
+        chunk.append(item)
+        input_tokens += item_input_tokens
+        output_tokens += item_output_tokens
+
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+# Function to check returned translations against the requested phrases
+def validate_translations(translation_list, translations, locale):
+    """Return (valid translations in request order, requested items that are still missing)."""
+    requested = {item['label_key']: item for item in translation_list}
+    returned = {}
+
+    for translation in translations or []:
+        if not isinstance(translation, dict):
+            continue
+        key = translation.get('key')
+        translated_value = translation.get('translated_value')
+        if key not in requested:
+            print(f"Warning: Ignoring unrequested key '{key}' returned for {locale}")
+            continue
+        if not isinstance(translated_value, str) or not translated_value.strip():
+            continue
+        returned[key] = {
+            "key": key,
+            "en": requested[key]['value'],
+            "translated_value": translated_value,
+            "locale": locale,
+        }
+
+    valid = [returned[key] for key in requested if key in returned]
+    missing = [item for key, item in requested.items() if key not in returned]
+    return valid, missing
+
+# Function to decide which phrases to resend after an attempt
+def next_attempt_chunks(translations, missing):
+    if translations is None and len(missing) > 1:
+        # The whole request failed (e.g. truncated JSON), so retry with smaller requests
+        middle = len(missing) // 2
+        return [missing[:middle], missing[middle:]]
+    return [missing] if missing else []
+
+# Function to return a chunk's translations in request order and report what could not be translated
+def collect_chunk_result(translation_list, valid_by_key, pending, locale):
+    failed = sum(len(chunk) for chunk in pending)
+    if failed:
+        print(f"Warning: {failed} of {len(translation_list)} phrases for {locale} could not be translated after {MAX_ATTEMPTS} attempts.")
+    return [valid_by_key[item['label_key']] for item in translation_list if item['label_key'] in valid_by_key]
+
+# Function to translate one chunk, retrying only the phrases that failed or were not returned
+def translate_chunk(translation_list, locale, client, controller=None):
+    valid_by_key = {}
+    pending = [translation_list]
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        retry = []
+        for chunk in pending:
+            translations = gpt_translate(chunk, locale, client, attempt, controller)
+            valid, missing = validate_translations(chunk, translations, locale)
+            valid_by_key.update((translation['key'], translation) for translation in valid)
+            retry.extend(next_attempt_chunks(translations, missing))
+        pending = retry
+        if not pending:
+            break
+
+    return collect_chunk_result(translation_list, valid_by_key, pending, locale)
+
+# Async variant of translate_chunk
+async def translate_chunk_async(translation_list, locale, client, controller=None):
+    valid_by_key = {}
+    pending = [translation_list]
+
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        retry = []
+        for chunk in pending:
+            translations = await gpt_translate_async(chunk, locale, client, attempt, controller)
+            valid, missing = validate_translations(chunk, translations, locale)
+            valid_by_key.update((translation['key'], translation) for translation in valid)
+            retry.extend(next_attempt_chunks(translations, missing))
+        pending = retry
+        if not pending:
+            break
+
+    return collect_chunk_result(translation_list, valid_by_key, pending, locale)
+
+# Function to check a multi-locale response locale by locale, returning [(locale, valid translations, missing items)]
+def validate_multi_locale_translations(translation_list, locales, translations_by_locale):
+    validated = []
+    for locale in locales:
+        translations = (translations_by_locale or {}).get(locale)
+        valid, missing = validate_translations(translation_list, translations if isinstance(translations, list) else None, locale)
+        validated.append((locale, valid, missing))
+    return validated
+
+# Function to merge retried translations into a locale's valid ones, keeping request order
+def merge_retried_translations(translation_list, valid, retried):
+    valid_by_key = {translation['key']: translation for translation in valid}
+    valid_by_key.update((translation['key'], translation) for translation in retried)
+    return [valid_by_key[item['label_key']] for item in translation_list if item['label_key'] in valid_by_key]
+
+# Function to translate one chunk into several locales with one request, returning [(locale, translations)].
+# Whatever a locale is missing from the response is retried with single-locale requests.
+def translate_multi_locale_chunk(translation_list, locales, client, controller=None):
+    translations_by_locale = gpt_translate_multi(translation_list, locales, client, controller)
+    results = []
+    for locale, valid, missing in validate_multi_locale_translations(translation_list, locales, translations_by_locale):
+        if missing:
+            print(f"Retrying {len(missing)} phrases for {locale} missing from the multi-locale response...")
+            valid = merge_retried_translations(translation_list, valid, translate_chunk(missing, locale, client, controller))
+        results.append((locale, valid))
+    return results
+
+# Async variant of translate_multi_locale_chunk
+async def translate_multi_locale_chunk_async(translation_list, locales, client, controller=None):
+    translations_by_locale = await gpt_translate_multi_async(translation_list, locales, client, controller)
+    results = []
+    for locale, valid, missing in validate_multi_locale_translations(translation_list, locales, translations_by_locale):
+        if missing:
+            print(f"Retrying {len(missing)} phrases for {locale} missing from the multi-locale response...")
+            retried = await translate_chunk_async(missing, locale, client, controller)
+            valid = merge_retried_translations(translation_list, valid, retried)
+        results.append((locale, valid))
+    return results
+
+# Function to plan multi-locale requests: phrases needed by the same locales are requested together,
+# for at most locales_per_request locales at a time, in chunks sized for every locale's output
+def plan_multi_locale_jobs(pending_by_locale, locales_per_request, max_input_tokens=DEFAULT_MAX_INPUT_TOKENS,
+                           max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS):
+    items_by_key, locales_by_key = {}, {}
+    for locale, translation_list in pending_by_locale.items():
+        for item in translation_list:
+            items_by_key.setdefault(item['label_key'], item)
+            locales_by_key.setdefault(item['label_key'], {})[locale] = None
+
+    items_by_locales = {}
+    for key, key_locales in locales_by_key.items():
+        items_by_locales.setdefault(tuple(key_locales), []).append(items_by_key[key])
+
+    jobs = []
+    for locales, translation_list in items_by_locales.items():
+        for start in range(0, len(locales), locales_per_request):
+            locale_group = list(locales[start:start + locales_per_request])
+            for chunk in chunk_translation_list(translation_list, None, max_input_tokens, max_output_tokens,
+                                                MULTI_LOCALE_SYSTEM_PROMPT, len(locale_group)):
+                jobs.append((locale_group, chunk))
+    return jobs
+
+# Function to split a locale's phrases into translations found in the translation memory and phrases still to translate
+def lookup_translation_memory(translation_memory, translation_list, locale):
+    prompt_hash = hash_text(build_system_prompt(locale))
+    cached, uncached = [], []
+
+    for item in translation_list:
+        translated_value = None
+        if isinstance(item['value'], str):
+            translated_value = translation_memory.lookup(item['value'], locale, MODEL, prompt_hash)
+        if translated_value is None:
+            uncached.append(item)
+        else:
+            cached.append({"key": item['label_key'], "en": item['value'], "translated_value": translated_value, "locale": locale})
+
+    return cached, uncached
+
+# Function to collapse phrases whose English text is the same (ignoring whitespace) into one request item
+def dedupe_translation_list(translation_list, exclude_patterns=()):
+    """Return (items to translate, {label_key of a translated item: [items that share its text]})."""
+    unique, shared, representative_by_text = [], {}, {}
+    for item in translation_list:
+        value = item['value']
+        if not isinstance(value, str) or any(fnmatch.fnmatchcase(item['label_key'], pattern) for pattern in exclude_patterns):
+            unique.append(item)
+            continue
+        text = ' '.join(value.split())
+        representative = representative_by_text.setdefault(text, item)
+        if representative is item:
+            unique.append(item)
+        else:
+            shared.setdefault(representative['label_key'], []).append(item)
+    return unique, shared
+
+# Function to keep a phrase's own leading and trailing whitespace on a translation shared from another key
+def match_whitespace(source, translated_value):
+    leading = source[:len(source) - len(source.lstrip())]
+    trailing = source[len(source.rstrip()):]
+    return leading + translated_value.strip() + trailing
+
+# Function to copy each translation to the keys that were deduplicated into it
+def fan_out_translations(translations, shared):
+    fanned_out = []
+    for translation in translations:
+        fanned_out.append(translation)
+        for item in shared.get(translation['key'], ()):
+            translated_value = translation['translated_value']
+            if item['value'] != translation['en']:
+                translated_value = match_whitespace(item['value'], translated_value)
+            fanned_out.append({**translation, "key": item['label_key'], "en": item['value'], "translated_value": translated_value})
+    return fanned_out
+
+# Function to record new translations in the translation memory
+def store_translation_memory(translation_memory, translations, locale):
+    prompt_hash = hash_text(build_system_prompt(locale))
+    for translation in translations:
+        # Only text is looked up, so only text is stored (an empty English string is read from the CSV as NaN)
+        if not isinstance(translation['en'], str) or not isinstance(translation['translated_value'], str):
+            continue
+        item = {"label_key": translation['key'], "value": translation['en']}
+        tokens = sum(estimate_item_tokens(item))
+        translation_memory.store(translation['en'], locale, MODEL, prompt_hash, translation['translated_value'], tokens)
+    translation_memory.connection.commit()
+
+# Function to translate every chunk concurrently, returning results in the order of the jobs
+# (translate_job is translate_chunk_async, or translate_multi_locale_chunk_async for multi-locale jobs;
+# on_result(target, result) is called as each job finishes)
+async def translate_jobs_async(jobs, concurrency, controller=None, translate_job=None, on_result=None):
+    semaphore = asyncio.Semaphore(concurrency)
+    translate_job = translate_job or translate_chunk_async
+
+    # With a rate controller, retries are its job rather than the client's
+    async with AsyncOpenAI(**({'max_retries': 0} if controller else {})) as client:
+        async def translate(target, translation_list):
+            async with semaphore:
+                result = await translate_job(translation_list, target, client, controller)
+            if on_result is not None:
+                on_result(target, result)
+            return result
+
+        return await asyncio.gather(*(translate(target, translation_list) for target, translation_list in jobs))
+
+# Function to translate every chunk through one Batch API job, returning results in the order of the jobs
+def translate_jobs_batch(jobs, batch_dir, poll_interval, controller=None):
+    # The upload, polling and download keep the SDK's retries, so one transient error does not drop the batch.
+    # The controller retries the synchronous fallbacks itself, so their client has the SDK's retries turned off.
+    client = OpenAI()
+    fallback_client = OpenAI(max_retries=0) if controller else client
+    requests = [(f"{index}-{locale}", build_request_body(translation_list, locale))
+                for index, (locale, translation_list) in enumerate(jobs)]
+    try:
+        bodies = run_batch(client, requests, batch_dir, poll_interval)
+        batch_failed = False
+    except OpenAIError as e:
+        # Every job then falls back to synchronous requests below
+        print(f"OpenAI API Error: Batch request failed, translating {len(jobs)} chunks synchronously instead: {str(e)}")
+        bodies, batch_failed = {}, True
+
+    results = []
+    for (custom_id, _), (locale, translation_list) in zip(requests, jobs):
+        translations = None
+        status = 'api_error' if batch_failed else 'missing'
+        body = bodies.get(custom_id)
+        if body is not None:
+            choice = body['choices'][0]
+            try:
+                translations = parse_translation_content(choice['message']['content'], choice.get('finish_reason'))
+                status = 'ok' if translations is not None else 'invalid_response'
+            except json.JSONDecodeError as e:
+                status = 'json_error'
+                print(f"JSON Error ({custom_id}): {str(e)}")
+        metrics.api_call(locale, len(translation_list), None, (body or {}).get('usage'), status, mode='batch')
+        valid, missing = validate_translations(translation_list, translations, locale)
+
+        # Fall back to synchronous requests for whatever the batch did not deliver
+        if missing:
+            print(f"Retrying {len(missing)} phrases for {locale} missing from batch request {custom_id}...")
+            valid = merge_retried_translations(translation_list, valid, translate_chunk(missing, locale, fallback_client, controller))
+        results.append(valid)
+
+    return results
 
 # Function to process missing translations in batches and update the DataFrame
-def process_missing_translations(english_labels_df, locale_key_comparison_df):
-    # Filter rows with missing translations
-    missing_translations_df = locale_key_comparison_df[locale_key_comparison_df['status'] == 'missing']
+def process_missing_translations(english_labels_df, locale_key_comparison_df, concurrency=1,
+                                 max_input_tokens=DEFAULT_MAX_INPUT_TOKENS, max_output_tokens=DEFAULT_MAX_OUTPUT_TOKENS,
+                                 translation_memory=None, batch_dir=None, batch_poll_interval=30,
+                                 output_dir='locale_comparison', rate_controller=None, dedupe=True, dedupe_exclude=(),
+                                 locales_per_request=1, journal=None):
+    # Filter rows with missing translations, and stale ones whose English source changed since they were translated
+    missing_translations_df = locale_key_comparison_df[locale_key_comparison_df['status'].isin(['missing', 'stale'])]
     
     # Merge with english_labels_df to get English values corresponding to the missing label_keys
     missing_with_english_df = missing_translations_df.merge(
@@ -144,30 +732,99 @@ def process_missing_translations(english_labels_df, locale_key_comparison_df):
         how='left'
     )
     
-    # Group missing translations by locale
+    # Group missing translations by locale, reuse what the translation memory already knows
+    # and split the rest of each locale into token-budgeted chunks
     locales = missing_with_english_df['locale'].unique()
-    
-    all_translations = []
-    
-    # Process each locale separately
+    requested_keys = {}
+    translations_by_locale = {}
+    shared_by_locale = {}
+    pending_by_locale = {}
     for locale in locales:
         locale_missing = missing_with_english_df[missing_with_english_df['locale'] == locale]
         translation_list = locale_missing[['label_key', 'value']].to_dict(orient='records')
-        
-        # Call GPT-4 to translate the batch of phrases for this locale
-        translations = gpt_translate(translation_list, locale)
+        requested_keys[locale] = [item['label_key'] for item in translation_list]
+        translations_by_locale[locale] = {}
+
+        # Skip what an interrupted run already translated, then what the translation memory knows
+        if journal is not None:
+            journaled, translation_list = journal.lookup(translation_list, locale)
+            translations_by_locale[locale].update((translation['key'], translation) for translation in journaled)
+        if translation_memory is not None:
+            cached, translation_list = lookup_translation_memory(translation_memory, translation_list, locale)
+            translations_by_locale[locale].update((translation['key'], translation) for translation in cached)
+
+        # Send each distinct English text once per locale and copy its translation to every key sharing it
+        if dedupe:
+            to_translate = len(translation_list)
+            translation_list, shared_by_locale[locale] = dedupe_translation_list(translation_list, dedupe_exclude)
+            deduplicated = to_translate - len(translation_list)
+            if deduplicated:
+                print(f"{deduplicated} of {to_translate} phrases for {locale} reuse the translation of an identical English text")
+                metrics.count('deduplicated_phrases', deduplicated)
+
+        pending_by_locale[locale] = translation_list
 
+    # Split the phrases into token-budgeted requests: one locale each, or several locales sharing one request
+    multi_locale = locales_per_request > 1 and not batch_dir
+    if multi_locale:
+        jobs = plan_multi_locale_jobs(pending_by_locale, locales_per_request, max_input_tokens, max_output_tokens)
+    else:
+        jobs = [(locale, chunk) for locale, translation_list in pending_by_locale.items()
+                for chunk in chunk_translation_list(translation_list, locale, max_input_tokens, max_output_tokens)]
+
+    if journal is not None and journal.resumed:
+        print(f"Resumed {journal.resumed} translations from {journal.path}")
+
+    # Record each job's translations as soon as it finishes, so an interrupted run keeps them
+    def record_result(target, result):
+        for locale, translations in (result if multi_locale else [(target, result)]):
+            translations = fan_out_translations(translations, shared_by_locale.get(locale, {}))
+            translations_by_locale[locale].update((translation['key'], translation) for translation in translations)
+            if journal is not None:
+                journal.append(translations)
+            if translation_memory is not None:
+                store_translation_memory(translation_memory, translations, locale)
+
+    # Call GPT-4 to translate each chunk, concurrently if requested, within the rate limits
+    if rate_controller is None:
+        rate_controller = RateController(concurrency)
+    translate_job = translate_multi_locale_chunk if multi_locale else translate_chunk
+    phrases = sum(len(translation_list) * (len(target) if multi_locale else 1) for target, translation_list in jobs)
+    with metrics.span('translate_requests', keys=phrases, requests=len(jobs)):
+        if not jobs:
+            pass
+        elif batch_dir:
+            results = translate_jobs_batch(jobs, batch_dir, batch_poll_interval, rate_controller)
+            for (locale, _), translations in zip(jobs, results):
+                record_result(locale, translations)
+        elif concurrency > 1:
+            asyncio.run(translate_jobs_async(jobs, concurrency, rate_controller,
+                                             translate_multi_locale_chunk_async if multi_locale else None, record_result))
+        else:
+            client = OpenAI(max_retries=0)
+            for target, translation_list in jobs:
+                record_result(target, translate_job(translation_list, target, client, rate_controller))
+    if jobs and not batch_dir:
+        print(rate_controller.summary())
+    metrics.count('rate_limited', rate_controller.stats['rate_limited'])
+    metrics.count('request_retries', rate_controller.stats['retries'])
+
+    # Collect the results in locale and request order so the output matches a sequential run
+    all_translations = []
+    for locale, translations_by_key in translations_by_locale.items():
+        translations = [translations_by_key[key] for key in requested_keys[locale] if key in translations_by_key]
         if translations:
-            print(f"Translations returned for {locale}: {translations}")
+            print(f"{len(translations)} translations returned for {locale}")
             all_translations.extend(translations)
         else:
             print(f"Warning: No translations were returned for {locale}.")
     
     # Save intermediate translations to avoid repeating the whole process
     if all_translations:
-        with open('locale_comparison/intermediate_translations.json', 'w', encoding='utf-8') as f:
+        intermediate_path = os.path.join(output_dir, 'intermediate_translations.json')
+        with open(intermediate_path, 'w', encoding='utf-8') as f:
             json.dump(all_translations, f, ensure_ascii=False, indent=4)
-            print("Saved intermediate translations to 'intermediate_translations.json'")
+            print(f"Saved intermediate translations to '{intermediate_path}'")
     
     return all_translations
 
@@ -185,26 +842,38 @@ def update_translations_in_dataframe(translations, locale_key_comparison_df):
     if 'translated_length' not in locale_key_comparison_df.columns:
         locale_key_comparison_df['translated_length'] = None
 
-    # Update DataFrame with new translations
-    for translation in translations:
-        label_key = translation['key']
-        translated_value = translation['translated_value']
-        original_en_value = translation['en']
+    if not translations:
+        return locale_key_comparison_df
 
-        # Find the rows to update
-        mask = (locale_key_comparison_df['label_key'] == label_key) & \
-               (locale_key_comparison_df['locale'] == translation['locale'])
+    # Build one row per (locale, label_key); later translations win, as they would when applied one by one
+    translations_df = pd.DataFrame(translations, columns=['key', 'en', 'translated_value', 'locale'])
+    translations_df = translations_df.rename(columns={'key': 'label_key', 'en': 'original_en_value'})
+    translations_df = translations_df.drop_duplicates(subset=['locale', 'label_key'], keep='last')
 
-        if not mask.any():
-            print(f"Warning: No matching row found for key '{label_key}' and locale '{translation['locale']}'")
-            continue
+    # Join the translations onto the comparison rows by (locale, label_key)
+    merged = locale_key_comparison_df[['locale', 'label_key']].merge(
+        translations_df, on=['locale', 'label_key'], how='left', indicator=True
+    )
+    matched = (merged['_merge'] == 'both').to_numpy()
+    updates = merged.loc[matched, ['translated_value', 'original_en_value']]
+    # Only text has a length: other values are masked out first, since .str.len() raises on a column of no strings
+    for column, length_column in [('original_en_value', 'en_length'), ('translated_value', 'translated_length')]:
+        values = updates[column]
+        updates[length_column] = values.where(values.map(type) == str).astype(object).str.len()
 
-        # Perform the updates
-        locale_key_comparison_df.loc[mask, 'translated_value'] = translated_value
-        locale_key_comparison_df.loc[mask, 'original_en_value'] = original_en_value
-        locale_key_comparison_df.loc[mask, 'en_length'] = len(original_en_value)
-        locale_key_comparison_df.loc[mask, 'translated_length'] = len(translated_value)
-        locale_key_comparison_df.loc[mask, 'status'] = 'translated'
+    # Report translations that have no matching row in one pass
+    unmatched = translations_df.merge(
+        locale_key_comparison_df[['locale', 'label_key']].drop_duplicates(),
+        on=['locale', 'label_key'], how='left', indicator=True
+    )
+    for label_key, locale in unmatched.loc[unmatched['_merge'] == 'left_only', ['label_key', 'locale']].itertuples(index=False):
+        print(f"Warning: No matching row found for key '{label_key}' and locale '{locale}'")
+
+    # Perform the updates
+    for column in ['translated_value', 'original_en_value', 'en_length', 'translated_length']:
+        locale_key_comparison_df[column] = locale_key_comparison_df[column].astype(object)
+        locale_key_comparison_df.loc[matched, column] = updates[column].to_numpy(dtype=object)
+    locale_key_comparison_df.loc[matched, 'status'] = 'translated'
 
     return locale_key_comparison_df
 
@@ -224,17 +893,41 @@ def main():
     english_labels_path = os.path.join(args.input_dir, 'english_labels.csv')
     locale_key_comparison_path = os.path.join(args.input_dir, 'locale_key_comparison_consolidated.csv')
     output_path = os.path.join(args.output_dir, 'translated_locale_key_comparison_consolidated.csv')
+    configure_api_endpoint(args.base_url)
     
-    english_labels_df, locale_key_comparison_df = load_csv_files(english_labels_path, locale_key_comparison_path)
-    
-    # Process the missing translations
-    translations = process_missing_translations(english_labels_df, locale_key_comparison_df)
-    
-    # Update the original DataFrame with translations
-    updated_locale_key_comparison_df = update_translations_in_dataframe(translations, locale_key_comparison_df)
-    
-    # Save the updated DataFrame
-    save_updated_df(updated_locale_key_comparison_df, output_path)
+    with instrumented_run('i18n_translator', args.output_dir, args):
+        with metrics.span('load_csv'):
+            english_labels_df, locale_key_comparison_df = load_csv_files(english_labels_path, locale_key_comparison_path)
+        translation_memory = None
+        if not args.no_translation_memory:
+            translation_memory = TranslationMemory(args.translation_memory, args.tm_ttl_days, args.tm_max_entries)
+
+        # Process the missing translations, journaling each completed request
+        journal = TranslationJournal(os.path.join(args.output_dir, JOURNAL_NAME), args.resume)
+        try:
+            with metrics.span('translate') as span:
+                translations = process_missing_translations(english_labels_df, locale_key_comparison_df, args.concurrency,
+                                                            args.max_input_tokens, args.max_output_tokens, translation_memory,
+                                                            args.output_dir if args.batch else None, args.batch_poll_interval,
+                                                            args.output_dir, rate_controller_from_args(args),
+                                                            not args.no_dedupe, args.dedupe_exclude, args.locales_per_request,
+                                                            journal)
+                span['keys'] = len(translations)
+        finally:
+            journal.close()
+        if translation_memory is not None:
+            print(translation_memory.summary())
+            metrics.count('translation_memory_hits', translation_memory.hits)
+            metrics.count('translation_memory_misses', translation_memory.misses)
+            translation_memory.close()
+
+        # Update the original DataFrame with translations
+        with metrics.span('update_dataframe', keys=len(translations)):
+            updated_locale_key_comparison_df = update_translations_in_dataframe(translations, locale_key_comparison_df)
+
+        # Save the updated DataFrame
+        with metrics.span('save_csv'):
+            save_updated_df(updated_locale_key_comparison_df, output_path)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,29 @@
+import pandas as pd
+
+from i18n_locale_tree import KeyEntry
+from i18n_patch_locales import source_records
+from i18n_source_hashes import load_source_hashes, record_source_hashes, stale_keys
+
+
+def test_non_string_leaves_are_not_stale_after_patching(tmp_path):
+    en_leaves = {'flag': True, 'tags': ['a', 'b'], 'count': 3, 'start': 'Start'}
+    # As read back from translated_locale_key_comparison_consolidated.csv
+    df = pd.DataFrame({
+        'locale': ['de'] * 4,
+        'label_key': ['flag', 'tags', 'count', 'start'],
+        'original_en_value': ['True', "['a', 'b']", '3', 'Start'],
+        'translated_value': ['True', "['a', 'b']", '3', 'Starten'],
+    })
+    sidecar = str(tmp_path / '.i18n_source_hashes.json')
+
+    record_source_hashes(sidecar, source_records(df, {'main.json': en_leaves}))
+
+    en_data = {key: KeyEntry('main.json', value) for key, value in en_leaves.items()}
+    assert stale_keys(en_data, en_data, load_source_hashes(sidecar)['de']) == set()
+
+
+def test_changed_english_is_stale():
+    df = pd.DataFrame({'locale': ['de'], 'label_key': ['flag'], 'original_en_value': ['True'], 'translated_value': ['True']})
+    records = source_records(df, {'main.json': {'flag': False}})
+
+    assert records == [('de', 'flag', 'True')]
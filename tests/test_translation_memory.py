@@ -0,0 +1,22 @@
+import math
+
+from i18n_translation_memory import TranslationMemory
+from i18n_translator import lookup_translation_memory, store_translation_memory
+
+
+def test_store_skips_non_text_english(tmp_path):
+    translation_memory = TranslationMemory(str(tmp_path / 'tm.sqlite'))
+    translations = [
+        {"key": "empty", "en": math.nan, "translated_value": "", "locale": "de"},
+        {"key": "flag", "en": True, "translated_value": True, "locale": "de"},
+        {"key": "start", "en": "Start", "translated_value": "Starten", "locale": "de"},
+    ]
+
+    store_translation_memory(translation_memory, translations, 'de')
+
+    assert translation_memory.stored == 1
+    cached, uncached = lookup_translation_memory(
+        translation_memory, [{"label_key": "start", "value": "Start"}, {"label_key": "empty", "value": math.nan}], 'de')
+    assert [translation['translated_value'] for translation in cached] == ["Starten"]
+    assert [item['label_key'] for item in uncached] == ["empty"]
+    translation_memory.close()